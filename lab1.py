@@ -4,7 +4,8 @@ import numpy as np
 from PySide6.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QWidget,
                                QLineEdit, QPushButton, QLabel, QHBoxLayout,
                                QMessageBox, QGroupBox, QScrollArea, QComboBox)
-from PySide6.QtGui import QPainter, QPen, QColor, QPainterPath, QBrush, QFont
+from PySide6.QtGui import (QPainter, QPen, QColor, QPainterPath, QBrush, QFont,
+                           QFontMetricsF, QStaticText, QTransform)
 from PySide6.QtCore import Qt, QPointF, QSize
 
 # Палитра
@@ -37,6 +38,8 @@ class ConesDataBase:
             ('(math.sin(x)/x', 'Функция sinc'),
             ('math.cosh(-0.5*x**3+math.log10(x))', 'Гиперболический косинус')
         ]
+        # Быстрый поиск описания по выражению
+        self.function_descriptions = dict(self.available_functions)
 
     def set_functions(self, funcs):
         """Установка активных функций"""
@@ -229,6 +232,15 @@ class PlotWidget(QWidget):
         self.cell_width = 20
         self.razmetka = 16
 
+        # Кэш подписей (пересобирается при обновлении данных)
+        self.axis_font = QFont()
+        self.axis_font.setPointSize(8)
+        self.legend_font = QFont()
+        self.legend_font.setPointSize(10)
+        self.y_labels = []
+        self.x_labels = []
+        self.legend_labels = []
+
         # Настройки внешнего вида
         self.setStyleSheet("""
             background-color: #FFFFFF;
@@ -257,8 +269,61 @@ class PlotWidget(QWidget):
         self.scale_x = 480 / self.cell_height
         self.scale_y = 640 / self.cell_width
 
+        self.prepare_labels()
         self.update()
 
+    def make_static_text(self, text, font):
+        """Создаёт заранее размеченный QStaticText"""
+        static_text = QStaticText(text)
+        static_text.setTextFormat(Qt.PlainText)
+        static_text.prepare(QTransform(), font)
+        return static_text
+
+    def label_step(self, sizes, spacing):
+        """Шаг прореживания подписей: каждая N-я подпись, чтобы они не перекрывались"""
+        if not sizes or spacing <= 0:
+            return 1
+        return max(1, math.ceil(max(sizes) / spacing))
+
+    def prepare_labels(self):
+        """Подготовка подписей осей и легенды:
+        - текст форматируется и размечается один раз на обновление данных
+        - подписи прореживаются под доступное место в пикселях
+        - в paintEvent остаётся только drawStaticText"""
+        metrics = QFontMetricsF(self.axis_font)
+        ascent = metrics.ascent()
+
+        # Подписи оси Y (вдоль горизонтали, шаг scale_y)
+        minw = min(min(self.masses[2]), 0)
+        maxw = max(max(self.masses[1]), 0)
+        cells_y = np.linspace(minw, maxw, num=self.vert_lines).tolist()
+        texts_y = [f"{round(y, 2)}" for y in cells_y]
+        step = self.label_step([metrics.horizontalAdvance(t) for t in texts_y], self.scale_y)
+        self.y_labels = []
+        for i in range(0, len(texts_y), step):
+            py = self.scale_y * (1 + i)
+            self.y_labels.append((QPointF(py - 7, 490 - ascent),
+                                  self.make_static_text(texts_y[i], self.axis_font)))
+
+        # Подписи оси X (вдоль вертикали, шаг scale_x)
+        minh = min(self.masses[0])
+        maxh = max(self.masses[0])
+        used_height = 480 - 1 * self.scale_x
+        x_s = np.linspace(minh, maxh, num=len(self.masses[0])).tolist()
+        step = self.label_step([metrics.height()], self.scale_x)
+        self.x_labels = []
+        for i in range(0, len(x_s), step):
+            px = used_height - self.scale_x * i
+            self.x_labels.append((QPointF(650, px + 3 - ascent),
+                                  self.make_static_text(f"{round(x_s[i], 2)}", self.axis_font)))
+
+        # Подписи легенды
+        legend_ascent = QFontMetricsF(self.legend_font).ascent()
+        self.legend_labels = []
+        for function in self.functions:
+            func_desc = self.cones_db.function_descriptions.get(function, function)
+            self.legend_labels.append((legend_ascent, self.make_static_text(func_desc, self.legend_font)))
+
     def paintEvent(self, event):
         """Отрисовка виджета"""
         painter = QPainter(self)
@@ -311,47 +376,21 @@ class PlotWidget(QWidget):
 
     def draw_axes(self, painter):
         """Отрисовка осей"""
-        scale_x, scale_y = self.scale_x, self.scale_y
-        crosses = self.crosses_line()
-
-        minw = min(min(self.masses[2]), 0)
-        maxw = max(max(self.masses[1]), 0)
-        used_width = 640 - 2 * scale_y
-
-        minh = min(self.masses[0])
-        maxh = max(self.masses[0])
-        used_height = 480 - 1 * scale_x
-
-        cross_y = crosses
+        cross_y = self.crosses_line()
 
         # Ось Y
         painter.setPen(QPen(Qt.black, 2))
         painter.drawLine(cross_y, 0, cross_y, 480)
 
-        # Подписи оси Y
-        nps_y = np.linspace(minw, maxw, num=self.vert_lines)
-        cells_y = nps_y.tolist()
-
-        font = QFont()
-        font.setPointSize(8)
-        painter.setFont(font)
-
+        # Подписи осей (подготовлены в prepare_labels)
+        painter.setFont(self.axis_font)
         painter.setPen(QPen(QColor("#FFFFFF"), 1))
 
-        for i in range(len(cells_y)):
-            py = scale_y * (1 + i)
-            y = cells_y[i]
-            painter.drawText(py - 7, 490, f"{round(y, 2)}")
+        for pos, static_text in self.y_labels:
+            painter.drawStaticText(pos, static_text)
 
-        # Подписи оси X
-        cell_scale_x = len(self.masses[0])
-        npx_s = np.linspace(minh, maxh, num=cell_scale_x)
-        x_s = npx_s.tolist()
-
-        for i in range(len(x_s)):
-            px = used_height - scale_x * i
-            x = x_s[i]
-            painter.drawText(650, px + 3, f"{round(x, 2)}")
+        for pos, static_text in self.x_labels:
+            painter.drawStaticText(pos, static_text)
 
     def draw_cones(self, painter, cones_data):
         """
@@ -474,9 +513,7 @@ class PlotWidget(QWidget):
         legend_width, legend_height = 700, 50
         color_num = 0
 
-        font = QFont()
-        font.setPointSize(10)
-        painter.setFont(font)
+        painter.setFont(self.legend_font)
 
         # Рамка легенды
         painter.setPen(QPen(QColor("#E0E0E0"), 1))
@@ -484,17 +521,13 @@ class PlotWidget(QWidget):
         painter.drawRoundedRect(legend_width - 10, legend_height - 20,
                                 250, 20 + len(self.functions) * 20, 5, 5)
 
-        for i, function in enumerate(self.functions):
+        for i, (ascent, static_text) in enumerate(self.legend_labels):
             color = COLOR_PALETTE[color_num % len(COLOR_PALETTE)]
             painter.setPen(QPen(color, 3))
             painter.drawLine(legend_width, legend_height, legend_width + 20, legend_height)
 
-            # Поиск описания функции
-            func_desc = next((desc for expr, desc in self.cones_db.available_functions
-                              if expr == function), function)
-
             painter.setPen(QPen(Qt.black, 1))
-            painter.drawText(legend_width + 30, legend_height + 5, func_desc)
+            painter.drawStaticText(QPointF(legend_width + 30, legend_height + 5 - ascent), static_text)
             legend_height += 20
             color_num += 1
 
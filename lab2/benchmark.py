@@ -0,0 +1,221 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+# Без окна: сцена рисуется в QImage на платформе offscreen
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import numpy as np
+from PySide6.QtWidgets import QApplication
+from PySide6.QtGui import QImage
+from scene import SceneWidget, PROFILE_STAGES, STAGE_TRANSFORM
+from letters import ShadingMode, LetterStyle
+from raster import Rasterizer, RenderBackend
+
+RESOLUTIONS = [(320, 240), (800, 600), (1280, 720)]
+GOLDEN_RESOLUTIONS = [(320, 240)]
+SCALING_RESOLUTION = (3840, 2160)
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden')
+# Эталоны QPainter отличаются от кадров исходного рисовальщика только там, где тот рисовал
+# нелицевые грани поверх лицевых: их убрали отсечение нелицевых граней и порядок по BSP-дереву.
+# Длинный текст растеризуется при любом выборе (RASTER_LETTERS), поэтому его эталоны QPainter — растровые
+
+# Допуск сравнения с эталоном: средняя разница каналов и доля сильно отличающихся пикселей
+MEAN_TOLERANCE = 1.0
+PIXEL_THRESHOLD = 32
+PIXEL_FRACTION_TOLERANCE = 0.005
+
+
+def setup_default(scene):
+    pass
+
+
+def setup_rotated(scene):
+    scene.apply_camera_rotation(1, 35)
+    scene.d_letter.rotate(1, 30)
+    scene.n_letter.rotate(0, 20)
+
+
+def setup_sized(scene):
+    for letter, (height, width, depth) in [(scene.d_letter, (150, 120, 40)), (scene.n_letter, (80, 40, 20))]:
+        letter.height, letter.width, letter.depth = height, width, depth
+        letter.update_geometry()
+
+
+def setup_round(scene):
+    scene.set_letter_style(LetterStyle.ROUND)
+    scene.apply_camera_rotation(1, 25)
+
+
+def setup_text(scene):
+    # Тысяча экземпляров букв (25 строк по 40): проверка пакетного преобразования на длинном тексте
+    alphabet = 'АБВГДЕЖЗИКЛМНОПРСТУФХЦЧШЭЮЯ'
+    lines = [''.join(alphabet[(row * 7 + column) % len(alphabet)] for column in range(40)) for row in range(25)]
+    scene.apply_text('\n'.join(lines))
+
+
+SCENES = {
+    'default': setup_default,
+    'rotated': setup_rotated,
+    'sized': setup_sized,
+    'round': setup_round,
+    'text': setup_text,
+}
+
+
+def make_scene(scene_name, width, height, mode, backend):
+    scene = SceneWidget()
+    scene.resize(width, height)
+    SCENES[scene_name](scene)
+    scene.set_shading_mode(mode)
+    scene.set_render_backend(backend)
+    scene.invalidate_cache()
+    return scene
+
+
+def render(scene):
+    image = QImage(scene.width(), scene.height(), QImage.Format_RGB32)
+    scene.render(image)
+    return image
+
+
+def image_array(image):
+    image = image.convertToFormat(QImage.Format_RGB32)
+    data = np.frombuffer(image.constBits(), dtype=np.uint8).reshape(image.height(), image.bytesPerLine())
+    return data[:, :image.width() * 4].reshape(image.height(), image.width(), 4)[:, :, :3].astype(int)
+
+
+def compare_golden(name, image, update):
+    path = os.path.join(GOLDEN_DIR, f'{name}.png')
+    if update:
+        os.makedirs(GOLDEN_DIR, exist_ok=True)
+        image.save(path)
+        return {'status': 'updated'}
+    if not os.path.exists(path):
+        return {'status': 'missing'}
+    golden = QImage(path)
+    if golden.size() != image.size():
+        return {'status': 'failed', 'reason': 'size'}
+    diff = np.abs(image_array(image) - image_array(golden))
+    mean = float(diff.mean())
+    fraction = float((diff > PIXEL_THRESHOLD).any(axis=2).mean())
+    passed = mean <= MEAN_TOLERANCE and fraction <= PIXEL_FRACTION_TOLERANCE
+    return {'status': 'passed' if passed else 'failed', 'mean_diff': round(mean, 4),
+            'pixel_fraction': round(fraction, 5)}
+
+
+def measure(scene, frames):
+    # Камера поворачивается каждый кадр: пересчитываются проекция и отрисовка.
+    # Возвращает времена кадров в мс и суммарные времена этапов в секундах
+    times = []
+    stages = {stage: 0.0 for stage in PROFILE_STAGES}
+    for _ in range(frames):
+        scene.apply_camera_rotation(1, 1)
+        scene.invalidate_cache(STAGE_TRANSFORM)
+        started = time.perf_counter()
+        render(scene)
+        times.append(time.perf_counter() - started)
+        for stage in PROFILE_STAGES:
+            stages[stage] += scene.stage_times[stage]
+    return np.array(times) * 1000, stages
+
+
+def run_scaling(scene_name, mode, workers, frames):
+    # Растровый вывод в 4K с разным числом потоков плиток; ускорение — относительно одного потока
+    width, height = SCALING_RESOLUTION
+    results = []
+    for count in workers:
+        scene = make_scene(scene_name, width, height, mode, RenderBackend.RASTER)
+        scene.rasterizer = Rasterizer(workers=count)
+        render(scene)
+        times, stages = measure(scene, frames)
+        results.append({'scene': scene_name, 'width': width, 'height': height, 'mode': mode.name,
+                        'workers': count, 'frame_ms': round(float(times.mean()), 3),
+                        'draw_ms': round(stages['draw'] * 1000 / frames, 3)})
+        scene.deleteLater()
+    for result in results:
+        result['speedup'] = round(results[0]['draw_ms'] / result['draw_ms'], 2)
+    return results
+
+
+def run_case(scene_name, width, height, mode, backend, frames, update_golden, interactive=False):
+    scene = make_scene(scene_name, width, height, mode, backend)
+    name = f'{scene_name}_{width}x{height}_{mode.name}_{backend.name}'
+    result = {'name': name, 'scene': scene_name, 'width': width, 'height': height,
+              'mode': mode.name, 'backend': backend.name, 'interactive': interactive}
+
+    # Первый кадр строит весь кэш и сравнивается с эталоном
+    started = time.perf_counter()
+    image = render(scene)
+    result['first_frame_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    if (width, height) in GOLDEN_RESOLUTIONS:
+        result['golden'] = compare_golden(name, image, update_golden)
+    if interactive:
+        # Дальше кадры как при перетаскивании камеры: монотонная заливка в уменьшенном разрешении
+        scene.apply_interactive(True)
+
+    times, stages = measure(scene, frames)
+    result['frames'] = frames
+    result['fps'] = round(1000 / times.mean(), 2)
+    result['frame_ms'] = {
+        'mean': round(float(times.mean()), 3),
+        'p50': round(float(np.percentile(times, 50)), 3),
+        'p95': round(float(np.percentile(times, 95)), 3),
+    }
+    result['stages_ms'] = {stage: round(total * 1000 / frames, 3) for stage, total in stages.items()}
+    result['counts'] = dict(scene.cull_stats)
+    scene.deleteLater()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замер скорости отрисовки lab2 и сравнение с эталонными кадрами')
+    parser.add_argument('--frames', type=int, default=20, help='кадров на случай')
+    parser.add_argument('--output', help='файл для отчёта JSON (по умолчанию — стандартный вывод)')
+    parser.add_argument('--update-golden', action='store_true', help='перезаписать эталонные кадры')
+    parser.add_argument('--scenes', nargs='*', default=list(SCENES), choices=list(SCENES))
+    parser.add_argument('--quick', action='store_true', help='только разрешения эталонов')
+    parser.add_argument('--interactive', action='store_true',
+                        help='замерять кадры взаимодействия (эталоны сравниваются по первому, полному кадру)')
+    parser.add_argument('--scaling', action='store_true',
+                        help='вместо обычных случаев — ускорение растрового вывода от числа потоков')
+    parser.add_argument('--workers', type=int, nargs='*',
+                        default=[1] + [2 ** i for i in range(1, 6) if 2 ** i <= (os.cpu_count() or 1)],
+                        help='числа потоков для --scaling (по умолчанию степени двойки до числа ядер)')
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    if args.scaling:
+        report = {'cpu_count': os.cpu_count(), 'scaling': [
+            result for scene_name in args.scenes for mode in ShadingMode
+            for result in run_scaling(scene_name, mode, args.workers, args.frames)]}
+        write_report(report, args.output)
+        return 0
+    resolutions = GOLDEN_RESOLUTIONS if args.quick else RESOLUTIONS
+    cases = []
+    for scene_name in args.scenes:
+        for width, height in resolutions:
+            for backend in RenderBackend:
+                for mode in ShadingMode:
+                    cases.append(run_case(scene_name, width, height, mode, backend, args.frames,
+                                          args.update_golden, args.interactive))
+                    app.processEvents()
+
+    failed = [case['name'] for case in cases if case.get('golden', {}).get('status') in ('failed', 'missing')]
+    write_report({'cases': cases, 'golden_failed': failed}, args.output)
+    return 1 if failed else 0
+
+
+def write_report(report, output):
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, 'w', encoding='utf-8') as file:
+            file.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,286 @@
+import numpy as np
+
+# Допуск классификации вершин относительно плоскости
+PLANE_EPSILON = 1e-6
+
+
+class BSPNode:
+    def __init__(self, normal, offset):
+        # Плоскость разбиения: normal · x = offset, «перед» — где normal · x > offset
+        self.normal = normal
+        self.offset = offset
+        self.fragments = []
+        self.front = None
+        self.back = None
+
+
+class BSPTree:
+    # Дерево двоичного разбиения пространства: порядок отрисовки «от дальнего к ближнему»
+    # получается обходом по положению камеры, без сортировки.
+    # Многоугольники, пересекающие плоскость разбиения, разрезаются на фрагменты;
+    # новые вершины описываются в splits как (a, b, t) — точка на отрезке a -> b в доле t
+    def __init__(self, positions, polygons, normals, tags, candidates=5):
+        self.positions = [tuple(p) for p in np.asarray(positions, dtype=float).tolist()]
+        self.vertex_count = len(self.positions)
+        self.polygons = [list(p) for p in polygons]
+        self.normals = [tuple(n) for n in np.asarray(normals, dtype=float).tolist()]
+        self.tags = list(tags)
+        self.splits = []
+        self.candidates = candidates
+        self.root = self.build(list(range(len(self.polygons))))
+        self.compact()
+
+    def build(self, fragment_ids):
+        # Построение без рекурсии, чтобы глубина дерева не упиралась в стек Python
+        root_holder = BSPNode(None, None)
+        stack = [(fragment_ids, root_holder, 'front')]
+        while stack:
+            ids, parent, side = stack.pop()
+            if not ids:
+                continue
+            splitter = self.choose_splitter(ids)
+            normal = self.normals[splitter]
+            offset = self.distance(normal, 0.0, self.polygons[splitter][0])
+            node = BSPNode(normal, offset)
+            setattr(parent, side, node)
+
+            front, back = [], []
+            for fragment in ids:
+                # Сам разделитель всегда остаётся в узле, даже если он чуть неплоский
+                position, pieces = ('coplanar', None) if fragment == splitter else self.classify(fragment, normal, offset)
+                if position == 'coplanar':
+                    node.fragments.append(fragment)
+                elif position == 'front':
+                    front.append(fragment)
+                elif position == 'back':
+                    back.append(fragment)
+                else:
+                    front_piece, back_piece = pieces
+                    if front_piece is not None:
+                        front.append(front_piece)
+                    if back_piece is not None:
+                        back.append(back_piece)
+            stack.append((front, node, 'front'))
+            stack.append((back, node, 'back'))
+        return root_holder.front
+
+    def distance(self, normal, offset, vertex):
+        x, y, z = self.positions[vertex]
+        return normal[0] * x + normal[1] * y + normal[2] * z - offset
+
+    def choose_splitter(self, ids):
+        # Из нескольких кандидатов выбирается плоскость с наименьшим числом разрезов и перекосом
+        if len(ids) <= 2:
+            return ids[0]
+        step = max(1, len(ids) // self.candidates)
+        best, best_score = ids[0], None
+        for candidate in ids[::step][:self.candidates]:
+            normal = self.normals[candidate]
+            offset = self.distance(normal, 0.0, self.polygons[candidate][0])
+            front = back = splits = 0
+            for fragment in ids:
+                distances = [self.distance(normal, offset, v) for v in self.polygons[fragment]]
+                has_front = max(distances) > PLANE_EPSILON
+                has_back = min(distances) < -PLANE_EPSILON
+                if has_front and has_back:
+                    splits += 1
+                elif has_front:
+                    front += 1
+                elif has_back:
+                    back += 1
+            score = splits * 8 + abs(front - back)
+            if best_score is None or score < best_score:
+                best, best_score = candidate, score
+        return best
+
+    def classify(self, fragment, normal, offset):
+        polygon = self.polygons[fragment]
+        distances = [self.distance(normal, offset, v) for v in polygon]
+        has_front = max(distances) > PLANE_EPSILON
+        has_back = min(distances) < -PLANE_EPSILON
+        if not has_front and not has_back:
+            return 'coplanar', None
+        if not has_back:
+            return 'front', None
+        if not has_front:
+            return 'back', None
+        return 'spanning', self.split(fragment, polygon, distances)
+
+    def split(self, fragment, polygon, distances):
+        front_polygon, back_polygon = [], []
+        count = len(polygon)
+        for i in range(count):
+            a, b = polygon[i], polygon[(i + 1) % count]
+            da, db = distances[i], distances[(i + 1) % count]
+            if da >= -PLANE_EPSILON:
+                front_polygon.append(a)
+            if da <= PLANE_EPSILON:
+                back_polygon.append(a)
+            if (da > PLANE_EPSILON and db < -PLANE_EPSILON) or (da < -PLANE_EPSILON and db > PLANE_EPSILON):
+                vertex = self.add_split_vertex(a, b, da / (da - db))
+                front_polygon.append(vertex)
+                back_polygon.append(vertex)
+        return self.add_fragment(front_polygon, fragment), self.add_fragment(back_polygon, fragment)
+
+    def add_split_vertex(self, a, b, t):
+        pa, pb = self.positions[a], self.positions[b]
+        self.positions.append(tuple(pa[k] + t * (pb[k] - pa[k]) for k in range(3)))
+        self.splits.append((a, b, t))
+        return len(self.positions) - 1
+
+    def add_fragment(self, polygon, parent):
+        if len(set(polygon)) < 3:
+            return None
+        self.polygons.append(polygon)
+        self.normals.append(self.normals[parent])
+        self.tags.append(self.tags[parent])
+        return len(self.polygons) - 1
+
+    def nodes(self):
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            yield node
+            stack.append(node.front)
+            stack.append(node.back)
+
+    def compact(self):
+        # В дереве остаются только итоговые фрагменты, пронумерованные подряд
+        remap = {}
+        for node in self.nodes():
+            for fragment in node.fragments:
+                remap[fragment] = len(remap)
+        live = sorted(remap, key=remap.get)
+        self.polygons = [self.polygons[i] for i in live]
+        self.normals = [self.normals[i] for i in live]
+        self.tags = [self.tags[i] for i in live]
+        for node in self.nodes():
+            node.fragments = [remap[i] for i in node.fragments]
+
+    def state(self):
+        # Дерево плоскими массивами для сохранения на диск: узлы в прямом порядке обхода,
+        # у каждого номера переднего и заднего потомка (-1 — нет) и отрезок в списке фрагментов
+        nodes = list(self.nodes())
+        index = {id(node): i for i, node in enumerate(nodes)}
+        polygons, lengths = pad_polygons(self.polygons)
+        fragments = [fragment for node in nodes for fragment in node.fragments]
+        return {
+            'positions': np.array(self.positions, dtype=float).reshape(-1, 3),
+            'vertex_count': np.array(self.vertex_count),
+            'polygons': polygons,
+            'polygon_lengths': lengths,
+            'normals': np.array(self.normals, dtype=float).reshape(-1, 3),
+            'tags': np.array(self.tags, dtype=np.intp),
+            'splits': np.array(self.splits, dtype=float).reshape(-1, 3),
+            'node_normals': np.array([node.normal for node in nodes], dtype=float).reshape(-1, 3),
+            'node_offsets': np.array([node.offset for node in nodes], dtype=float),
+            'node_children': np.array([[index.get(id(node.front), -1), index.get(id(node.back), -1)]
+                                       for node in nodes], dtype=np.intp).reshape(-1, 2),
+            'node_fragments': np.array(fragments, dtype=np.intp),
+            'node_fragment_offsets': np.cumsum([0] + [len(node.fragments) for node in nodes]),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        # Восстановление без повторного построения
+        tree = cls.__new__(cls)
+        tree.positions = [tuple(p) for p in state['positions'].tolist()]
+        tree.vertex_count = int(state['vertex_count'])
+        tree.polygons = [row[:length] for row, length in zip(state['polygons'].tolist(),
+                                                           state['polygon_lengths'].tolist())]
+        tree.normals = [tuple(n) for n in state['normals'].tolist()]
+        tree.tags = state['tags'].tolist()
+        tree.splits = [(int(a), int(b), t) for a, b, t in state['splits'].tolist()]
+        tree.candidates = 5
+        nodes = [BSPNode(tuple(normal), offset) for normal, offset
+                 in zip(state['node_normals'].tolist(), state['node_offsets'].tolist())]
+        offsets = state['node_fragment_offsets'].tolist()
+        fragments = state['node_fragments'].tolist()
+        for i, (node, (front, back)) in enumerate(zip(nodes, state['node_children'].tolist())):
+            node.fragments = fragments[offsets[i]:offsets[i + 1]]
+            node.front = nodes[front] if front >= 0 else None
+            node.back = nodes[back] if back >= 0 else None
+        tree.root = nodes[0] if nodes else None
+        return tree
+
+    def back_to_front(self, eye):
+        # Обход от дальнего к ближнему относительно точки eye
+        order = []
+        stack = [self.root]
+        while stack:
+            item = stack.pop()
+            if item is None:
+                continue
+            if isinstance(item, list):
+                order.extend(item)
+                continue
+            if self.side(item, eye) >= 0:
+                near, far = item.front, item.back
+            else:
+                near, far = item.back, item.front
+            stack.append(near)
+            stack.append(item.fragments)
+            stack.append(far)
+        return order
+
+    @staticmethod
+    def side(node, eye):
+        normal = node.normal
+        return normal[0] * eye[0] + normal[1] * eye[1] + normal[2] * eye[2] - node.offset
+
+
+def apply_splits(values, splits, normalize=False):
+    # Значения атрибута в вершинах разреза; разрезы применяются по порядку,
+    # так как концы отрезка сами могут быть вершинами предыдущих разрезов
+    values = [np.asarray(v, dtype=float) for v in values]
+    for a, b, t in splits:
+        value = values[a] + t * (values[b] - values[a])
+        if normalize:
+            length = np.linalg.norm(value)
+            if length > 0:
+                value = value / length
+        values.append(value)
+    return np.array(values, dtype=float).reshape(len(values), -1)
+
+
+def pad_polygons(polygons):
+    # Многоугольники разной длины в массив P×K: короткие дополняются последней вершиной
+    lengths = np.array([len(p) for p in polygons], dtype=np.intp)
+    width = int(lengths.max()) if len(polygons) else 3
+    padded = np.array([list(p) + [p[-1]] * (width - len(p)) for p in polygons],
+                      dtype=np.intp).reshape(len(polygons), width)
+    return padded, lengths
+
+
+def fan_triangulate(padded, lengths):
+    # Веерная триангуляция (0, i, i + 1) дополненных многоугольников и номер многоугольника у треугольника
+    count, width = padded.shape
+    if width < 3 or count == 0:
+        return np.zeros((0, 3), dtype=np.intp), np.zeros(0, dtype=np.intp)
+    fans = np.stack([padded[:, [0, i, i + 1]] for i in range(1, width - 1)], axis=1)
+    valid = np.arange(2, width)[None, :] < lengths[:, None]
+    owners = np.broadcast_to(np.arange(count)[:, None], valid.shape)
+    return fans[valid], owners[valid]
+
+
+def separate_boxes(items):
+    # Дерево разделяющих плоскостей, параллельных осям, над группами с ограничивающими
+    # параллелепипедами (ключ, минимум, максимум). Узел ('plane', ось, значение, ниже, выше);
+    # неразделимые группы собираются в лист ('group', [ключи]). Из всех промежутков
+    # берётся ближайший к середине, чтобы дерево оставалось сбалансированным и для длинного текста
+    if len(items) == 1:
+        return ('group', [items[0][0]])
+    for axis in range(3):
+        ordered = sorted(items, key=lambda item: item[1][axis])
+        highest = ordered[0][2][axis]
+        best = None
+        for i in range(1, len(ordered)):
+            if ordered[i][1][axis] > highest and (best is None or abs(2 * i - len(ordered)) < abs(2 * best[0] - len(ordered))):
+                best = (i, (highest + ordered[i][1][axis]) / 2)
+            highest = max(highest, ordered[i][2][axis])
+        if best is not None:
+            i, value = best
+            return ('plane', axis, value, separate_boxes(ordered[:i]), separate_boxes(ordered[i:]))
+    return ('group', [item[0] for item in items])
@@ -0,0 +1,278 @@
+import math
+import numpy as np
+from PySide6.QtGui import QFont, QFontMetricsF, QPainterPath
+
+# Допуск спрямления кривых контура в единицах сцены
+GLYPH_TOLERANCE = 0.5
+# Совпадающие точки контура после спрямления
+POINT_EPSILON = 1e-9
+# Допуск плоскостности грани в долях размера буквы
+PLANE_TOLERANCE = 1e-6
+# Наибольший сдвиг вершины фаски в острых углах, в долях ширины фаски
+MITER_LIMIT = 2.0
+
+
+def glyph_font(pixel_size=100):
+    font = QFont()
+    font.setBold(True)
+    font.setPixelSize(max(1, int(round(pixel_size))))
+    return font
+
+
+def glyph_path(char, font):
+    path = QPainterPath()
+    path.addText(0, 0, font, char)
+    return path
+
+
+def glyph_scale(font, size):
+    # Высота прописной буквы шрифта приводится к высоте size, как у букв Д и Н
+    cap_height = QFontMetricsF(font).capHeight()
+    return size / cap_height if cap_height > 0 else size / max(1, font.pixelSize())
+
+
+def flatten_path(path, tolerance):
+    # Контуры глифа ломаными; кубическая кривая делится на столько отрезков,
+    # чтобы отклонение от неё не превышало tolerance
+    contours, current = [], []
+    i, count = 0, path.elementCount()
+    while i < count:
+        element = path.elementAt(i)
+        if element.isMoveTo():
+            if len(current) > 2:
+                contours.append(current)
+            current = [(element.x, element.y)]
+            i += 1
+        elif element.isLineTo():
+            current.append((element.x, element.y))
+            i += 1
+        else:
+            p0 = np.array(current[-1])
+            p1, p2, p3 = (np.array([path.elementAt(i + k).x, path.elementAt(i + k).y]) for k in range(3))
+            bend = max(np.linalg.norm(p0 - 2 * p1 + p2), np.linalg.norm(p1 - 2 * p2 + p3))
+            steps = max(1, math.ceil(math.sqrt(0.75 * bend / tolerance)))
+            for t in np.linspace(0, 1, steps + 1)[1:]:
+                s = 1 - t
+                point = s ** 3 * p0 + 3 * s * s * t * p1 + 3 * s * t * t * p2 + t ** 3 * p3
+                current.append((float(point[0]), float(point[1])))
+            i += 3
+    if len(current) > 2:
+        contours.append(current)
+    return [cleaned for cleaned in (clean_contour(c) for c in contours) if len(cleaned) > 2]
+
+
+def clean_contour(points):
+    # Без повторов подряд и замыкающей точки, совпадающей с первой
+    result = []
+    for point in points:
+        if not result or abs(point[0] - result[-1][0]) > POINT_EPSILON or abs(point[1] - result[-1][1]) > POINT_EPSILON:
+            result.append(point)
+    while len(result) > 1 and abs(result[0][0] - result[-1][0]) <= POINT_EPSILON \
+            and abs(result[0][1] - result[-1][1]) <= POINT_EPSILON:
+        result.pop()
+    return np.array(result, dtype=float).reshape(-1, 2)
+
+
+def signed_area(points):
+    x, y = points[:, 0], points[:, 1]
+    return 0.5 * float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+
+
+def point_in_polygon(point, polygon):
+    x, y = point
+    inside = False
+    for (x1, y1), (x2, y2) in zip(polygon, np.roll(polygon, -1, axis=0)):
+        if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+    return inside
+
+
+def group_contours(contours):
+    # Вложенность контуров: на чётной глубине — внешние (против часовой стрелки),
+    # на нечётной — отверстия (по часовой) внутри ближайшего внешнего
+    order = sorted(range(len(contours)), key=lambda i: -abs(signed_area(contours[i])))
+    depth, parent = {}, {}
+    for position, i in enumerate(order):
+        container = None
+        for j in reversed(order[:position]):
+            if point_in_polygon(contours[i][0], contours[j]):
+                container = j
+                break
+        depth[i] = 0 if container is None else depth[container] + 1
+        parent[i] = container
+    shapes = {}
+    for i in order:
+        area = signed_area(contours[i])
+        if depth[i] % 2 == 0:
+            shapes[i] = (i, [])
+            if area < 0:
+                contours[i] = contours[i][::-1]
+        else:
+            shapes[parent[i]][1].append(i)
+            if area > 0:
+                contours[i] = contours[i][::-1]
+    return list(shapes.values())
+
+
+def orient(p, q, r):
+    return (q[0] - p[0]) * (r[1] - p[1]) - (q[1] - p[1]) * (r[0] - p[0])
+
+
+def segments_cross(a, b, c, d):
+    # Собственное пересечение отрезков ab и cd (общие концы не считаются)
+    o1, o2 = orient(a, b, c), orient(a, b, d)
+    o3, o4 = orient(c, d, a), orient(c, d, b)
+    return o1 * o2 < 0 and o3 * o4 < 0
+
+
+def bridge_holes(points, outer, holes):
+    # Отверстия врезаются во внешний контур парой встречных рёбер, после чего
+    # получается один многоугольник для отсечения ушей. Отверстия берутся справа налево
+    ring = list(outer)
+    for hole in sorted(holes, key=lambda h: -points[h, 0].max()):
+        start = int(np.argmax(points[hole, 0]))
+        mx, my = points[hole[start]]
+        edges = [(ring[k], ring[(k + 1) % len(ring)]) for k in range(len(ring))]
+        for other in holes:
+            edges += [(other[k], other[(k + 1) % len(other)]) for k in range(len(other))]
+        best = None
+        for k, candidate in enumerate(ring):
+            cx, cy = points[candidate]
+            distance = (cx - mx) ** 2 + (cy - my) ** 2
+            if best is not None and distance >= best[0]:
+                continue
+            # Вершина может входить в кольцо несколько раз (общий мост нескольких отверстий):
+            # подходит то вхождение, в угол которого смотрит мост
+            if not inside_corner(points[ring[k - 1]], points[candidate], points[ring[(k + 1) % len(ring)]], (mx, my)):
+                continue
+            if any(segments_cross(points[hole[start]], points[candidate], points[a], points[b])
+                   for a, b in edges):
+                continue
+            best = (distance, k)
+        k = best[1] if best is not None else int(np.argmin(np.sum((points[ring] - (mx, my)) ** 2, axis=1)))
+        loop = hole[start:] + hole[:start + 1]
+        ring = ring[:k + 1] + loop + ring[k:]
+    return ring
+
+
+def inside_corner(previous, vertex, following, point):
+    # Лежит ли направление на point внутри угла многоугольника при вершине vertex
+    left_in = orient(previous, vertex, point) > 0
+    left_out = orient(vertex, following, point) > 0
+    if orient(previous, vertex, following) > 0:
+        return left_in and left_out
+    return left_in or left_out
+
+
+def ear_clip(points, ring):
+    # Отсечение ушей многоугольника против часовой стрелки; вершины мостов
+    # повторяются в кольце, поэтому точки сравниваются по номерам
+    ring = list(ring)
+    triangles = []
+    k = 0
+    while len(ring) > 3:
+        count = len(ring)
+        corners = points[ring]
+        for attempt in range(count):
+            k %= count
+            a, b, c = ring[k - 1], ring[k], ring[(k + 1) % count]
+            if is_ear(points[a], points[b], points[c], corners[~np.isin(ring, (a, b, c))]):
+                break
+            k += 1
+        else:
+            # Ушей нет (вырожденный остаток): срезается текущая вершина
+            k %= count
+        triangles.append((ring[k - 1], ring[k], ring[(k + 1) % count]))
+        del ring[k]
+    if len(ring) == 3:
+        triangles.append(tuple(ring))
+    return triangles
+
+
+def is_ear(a, b, c, others):
+    # Выпуклая вершина, в треугольнике которой нет других вершин кольца
+    if (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0]) <= POINT_EPSILON:
+        return False
+    inside = np.ones(len(others), dtype=bool)
+    for p, q in ((a, b), (b, c), (c, a)):
+        inside &= (q[0] - p[0]) * (others[:, 1] - p[1]) - (q[1] - p[1]) * (others[:, 0] - p[0]) >= 0
+    return not inside.any()
+
+
+def inset_directions(contour):
+    # Смещение вершин контура внутрь буквы: при сдвиге на r * направление вершина
+    # отстоит на r от обоих соседних рёбер. Внутренность всегда слева от ребра
+    # (внешние контуры против часовой стрелки, отверстия — по часовой)
+    edges = np.roll(contour, -1, axis=0) - contour
+    lengths = np.linalg.norm(edges, axis=1, keepdims=True)
+    normals = np.column_stack([-edges[:, 1], edges[:, 0]]) / np.where(lengths > 0, lengths, 1)
+    previous = np.roll(normals, 1, axis=0)
+    directions = (previous + normals) / np.maximum(1 + np.einsum('ij,ij->i', previous, normals), 1e-6)[:, None]
+    # Острые углы ограничиваются, чтобы фаска не выбрасывала длинные шипы
+    lengths = np.linalg.norm(directions, axis=1, keepdims=True)
+    return directions * np.minimum(1, MITER_LIMIT / np.maximum(lengths, 1e-12))
+
+
+def bevel_profile(depth, bevel, segments):
+    # Слои боковой поверхности от передней крышки к задней: (отступ внутрь, z).
+    # Один сегмент — фаска, несколько — скругление четвертью окружности
+    half = depth / 2
+    if bevel <= 0 or segments <= 0:
+        return [(0.0, -half), (0.0, half)]
+    angles = np.linspace(0, np.pi / 2, segments + 1)
+    front = [(bevel * (1 - np.sin(a)), -half + bevel * (1 - np.cos(a))) for a in angles]
+    return front + [(inset, -z) for inset, z in reversed(front)]
+
+
+def extrude_glyph(char, size, depth, font=None, tolerance=GLYPH_TOLERANCE, bevel=0.0, segments=0, offset_x=0.0):
+    # Сетка глифа: передняя крышка в z = -depth / 2, задняя в z = depth / 2 и боковые грани
+    # между слоями профиля по каждому ребру контура. Буква стоит на базовой линии (y = 0),
+    # отцентрована по x и сдвинута на offset_x.
+    # Возвращает вершины и грани по четыре индекса (треугольники дополнены последней вершиной)
+    font = font or glyph_font(size)
+    scale = glyph_scale(font, size)
+    contours = flatten_path(glyph_path(char, font), tolerance / scale)
+    if not contours:
+        return np.zeros((0, 3)), np.zeros((0, 4), dtype=np.intp)
+    contours = [np.column_stack([c[:, 0], -c[:, 1]]) * scale for c in contours]
+    shapes = group_contours(contours)
+
+    points = np.vstack(contours)
+    points[:, 0] += offset_x - (points[:, 0].min() + points[:, 0].max()) / 2
+    directions = np.vstack([inset_directions(c) for c in contours])
+    starts = np.cumsum([0] + [len(c) for c in contours])
+    rings = [list(range(starts[i], starts[i + 1])) for i in range(len(contours))]
+    layers = bevel_profile(depth, min(bevel, depth * 0.45), segments)
+
+    # Крышки триангулируются по контуру с отступом, общему для передней и задней
+    count = len(points)
+    back = (len(layers) - 1) * count
+    cap = points + layers[0][0] * directions
+    faces = []
+    for outer, holes in shapes:
+        for a, b, c in ear_clip(cap, bridge_holes(cap, rings[outer], [rings[h] for h in holes])):
+            faces.append([c, b, a, a])
+            faces.append([a + back, b + back, c + back, c + back])
+    for layer in range(len(layers) - 1):
+        near, far = layer * count, (layer + 1) * count
+        for ring in rings:
+            for a, b in zip(ring, ring[1:] + ring[:1]):
+                faces.append([a + near, b + near, b + far, a + far])
+
+    positions = np.vstack([np.column_stack([points + inset * directions, np.full(count, z)])
+                           for inset, z in layers])
+    return positions, split_warped(positions, np.array(faces, dtype=np.intp).reshape(-1, 4))
+
+
+def split_warped(positions, faces):
+    # В острых углах сдвиг фаски ограничен, и четырёхугольник боковой грани может
+    # выйти из плоскости. Такие грани делятся на два треугольника: BSP-дерево
+    # и нормали считают грань плоской
+    corners = positions[faces]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    lengths = np.linalg.norm(normals, axis=1)
+    offsets = np.einsum('ij,ij->i', normals, corners[:, 3] - corners[:, 0])
+    warped = np.abs(offsets) > PLANE_TOLERANCE * np.maximum(lengths, POINT_EPSILON) * np.ptp(positions)
+    first = faces[warped][:, [0, 1, 2, 2]]
+    second = faces[warped][:, [0, 2, 3, 3]]
+    return np.vstack([faces[~warped], first, second])
@@ -1,6 +1,13 @@
+import hashlib
 import math
+import os
+import numpy as np
+from collections import OrderedDict
+from PySide6.QtCore import QStandardPaths
 from PySide6.QtGui import QColor
 from enum import Enum
+from bsp import BSPTree, apply_splits, pad_polygons, fan_triangulate
+from glyphs import GLYPH_TOLERANCE, extrude_glyph, glyph_font, glyph_path, glyph_scale
 
 
 class ShadingMode(Enum):
@@ -9,7 +16,31 @@ class ShadingMode(Enum):
     PHONG = "Градиент Фонга"
 
 
+class LetterStyle(Enum):
+    FLAT = "Плоские"
+    BEVEL = "С фаской"
+    ROUND = "Скруглённые"
+
+
+# Уровни детализации букв из шрифта, от подробного к грубому:
+# (множитель допуска спрямления контура, сегментов профиля боковой грани)
+DETAIL_LEVELS = {
+    LetterStyle.FLAT: [(1, 0), (2, 0), (4, 0), (8, 0)],
+    LetterStyle.BEVEL: [(1, 1), (2, 1), (4, 1), (8, 1)],
+    LetterStyle.ROUND: [(1, 6), (2, 3), (4, 2), (8, 1)],
+}
+BEVEL_RATIO = 0.06  # ширина фаски и скругления в долях высоты буквы
+
+
+# Поворотов в кэше матриц; при переполнении кэш очищается целиком
+ROTATION_CACHE_SIZE = 1024
+
+
 class Vector3D:
+    # Без __dict__: векторов много, и каждый занимает только три поля.
+    # Операции с присваиванием (+=, -=, *=) меняют вектор на месте без новых объектов
+    __slots__ = ('x', 'y', 'z')
+
     def __init__(self, x, y, z):
         self.x = x
         self.y = y
@@ -24,6 +55,33 @@ class Vector3D:
     def __mul__(self, scalar):
         return Vector3D(self.x * scalar, self.y * scalar, self.z * scalar)
 
+    def __iadd__(self, other):
+        self.x += other.x
+        self.y += other.y
+        self.z += other.z
+        return self
+
+    def __isub__(self, other):
+        self.x -= other.x
+        self.y -= other.y
+        self.z -= other.z
+        return self
+
+    def __imul__(self, scalar):
+        self.x *= scalar
+        self.y *= scalar
+        self.z *= scalar
+        return self
+
+    def __iter__(self):
+        yield self.x
+        yield self.y
+        yield self.z
+
+    def set(self, x, y, z):
+        self.x, self.y, self.z = x, y, z
+        return self
+
     def length(self):
         return math.sqrt(self.x ** 2 + self.y ** 2 + self.z ** 2)
 
@@ -33,90 +91,202 @@ class Vector3D:
             return Vector3D(0, 0, 0)
         return Vector3D(self.x / length, self.y / length, self.z / length)
 
+    def normalize(self):
+        # Нормировка на месте
+        length = self.length()
+        if length != 0:
+            self *= 1 / length
+        return self
+
     def dot(self, other):
         return self.x * other.x + self.y * other.y + self.z * other.z
 
+    def to_array(self):
+        return np.array([self.x, self.y, self.z], dtype=float)
+
 
 class Matrix4x4:
-    def __init__(self):
-        self.m = [[0] * 4 for _ in range(4)]
-        self.m[0][0] = 1
-        self.m[1][1] = 1
-        self.m[2][2] = 1
-        self.m[3][3] = 1
+    # Матрица хранится массивом numpy 4×4 (m[i][j] по-прежнему строка i, столбец j).
+    # Произведения считаются одним matmul, повороты берутся из кэша по углу,
+    # а apply и apply_directions переводят сразу целый массив вершин
+    rotations = {}
+
+    __slots__ = ('m',)
+
+    def __init__(self, m=None):
+        self.m = np.identity(4) if m is None else np.array(m, dtype=float)
 
     def __mul__(self, other):
         if isinstance(other, Vector3D):
-            x = self.m[0][0] * other.x + self.m[0][1] * other.y + self.m[0][2] * other.z + self.m[0][3]
-            y = self.m[1][0] * other.x + self.m[1][1] * other.y + self.m[1][2] * other.z + self.m[1][3]
-            z = self.m[2][0] * other.x + self.m[2][1] * other.y + self.m[2][2] * other.z + self.m[2][3]
-            w = self.m[3][0] * other.x + self.m[3][1] * other.y + self.m[3][2] * other.z + self.m[3][3]
-            if w != 0:
-                x /= w
-                y /= w
-                z /= w
+            x, y, z, w = (self.m @ (other.x, other.y, other.z, 1.0)).tolist()
+            # У аффинных матриц w ровно 1, и деление не нужно
+            if w != 1 and w != 0:
+                x, y, z = x / w, y / w, z / w
             return Vector3D(x, y, z)
         elif isinstance(other, Matrix4x4):
-            result = Matrix4x4()
-            for i in range(4):
-                for j in range(4):
-                    result.m[i][j] = sum(self.m[i][k] * other.m[k][j] for k in range(4))
-            return result
+            return Matrix4x4(self.m @ other.m)
+        return NotImplemented
+
+    def __imul__(self, other):
+        # self = self * other без новой матрицы
+        np.matmul(self.m, other.m, out=self.m)
+        return self
+
+    def premultiply(self, other):
+        # self = other * self на месте — так буква накапливает повороты
+        np.matmul(other.m, self.m, out=self.m)
+        return self
+
+    def is_affine(self):
+        row = self.m[3]
+        return row[0] == 0 and row[1] == 0 and row[2] == 0 and row[3] == 1
+
+    def apply(self, points):
+        # Массив точек N×3 (или N×4 с единичной w) за одно умножение, с делением на w для проективных
+        points = np.asarray(points, dtype=float)
+        result = points[:, :3] @ self.m[:3, :3].T + self.m[:3, 3]
+        if not self.is_affine():
+            w = points[:, :3] @ self.m[3, :3] + self.m[3, 3]
+            result /= np.where(w != 0, w, 1)[:, None]
+        return result
+
+    def apply_directions(self, directions):
+        # Направления (нормали, векторы) N×3: без переноса
+        return np.asarray(directions, dtype=float) @ self.m[:3, :3].T
+
+    def to_array(self):
+        return self.m.copy()
+
+    def copy(self):
+        return Matrix4x4(self.m)
 
     @staticmethod
     def translation(x, y, z):
         mat = Matrix4x4()
-        mat.m[0][3] = x
-        mat.m[1][3] = y
-        mat.m[2][3] = z
+        mat.m[:3, 3] = (x, y, z)
         return mat
 
+    @classmethod
+    def rotation(cls, axis, angle):
+        # Поворот вокруг оси 0, 1 или 2 на угол в градусах; синусы считаются один раз на угол
+        key = (axis, angle)
+        cached = cls.rotations.get(key)
+        if cached is None:
+            if len(cls.rotations) >= ROTATION_CACHE_SIZE:
+                cls.rotations.clear()
+            rad = math.radians(angle)
+            c, s = math.cos(rad), math.sin(rad)
+            cached = np.identity(4)
+            i, j = [(1, 2), (0, 2), (0, 1)][axis]
+            # Вокруг y знаки синуса обратные: x' = x cos + z sin
+            sign = -1 if axis == 1 else 1
+            cached[i, i] = c
+            cached[i, j] = -s * sign
+            cached[j, i] = s * sign
+            cached[j, j] = c
+            cached.flags.writeable = False
+            cls.rotations[key] = cached
+        return Matrix4x4(cached)
+
     @staticmethod
     def rotation_x(angle):
-        mat = Matrix4x4()
-        rad = math.radians(angle)
-        mat.m[1][1] = math.cos(rad)
-        mat.m[1][2] = -math.sin(rad)
-        mat.m[2][1] = math.sin(rad)
-        mat.m[2][2] = math.cos(rad)
-        return mat
+        return Matrix4x4.rotation(0, angle)
 
     @staticmethod
     def rotation_y(angle):
-        mat = Matrix4x4()
-        rad = math.radians(angle)
-        mat.m[0][0] = math.cos(rad)
-        mat.m[0][2] = math.sin(rad)
-        mat.m[2][0] = -math.sin(rad)
-        mat.m[2][2] = math.cos(rad)
-        return mat
+        return Matrix4x4.rotation(1, angle)
 
     @staticmethod
     def rotation_z(angle):
-        mat = Matrix4x4()
-        rad = math.radians(angle)
-        mat.m[0][0] = math.cos(rad)
-        mat.m[0][1] = -math.sin(rad)
-        mat.m[1][0] = math.sin(rad)
-        mat.m[1][1] = math.cos(rad)
-        return mat
+        return Matrix4x4.rotation(2, angle)
 
     @staticmethod
     def scaling(sx, sy, sz):
         mat = Matrix4x4()
-        mat.m[0][0] = sx
-        mat.m[1][1] = sy
-        mat.m[2][2] = sz
+        mat.m[0, 0] = sx
+        mat.m[1, 1] = sy
+        mat.m[2, 2] = sz
         return mat
 
     def inverse_rotation(self):
         result = Matrix4x4()
-        for i in range(3):
-            for j in range(3):
-                result.m[i][j] = self.m[j][i]
+        result.m[:3, :3] = self.m[:3, :3].T
         return result
 
 
+class SceneNode:
+    # Узел графа сцены: локальное преобразование (поворот и перенос, затем масштаб)
+    # и потомки. Мировая матрица и матрица нормалей кэшируются до изменения узла
+    # или его предка; изменение помечает устаревшим только поддерево узла.
+    # version растёт при каждом таком изменении — по ней кэши сцены узнают, что пересчитывать
+    def __init__(self, transform=None, scale=1.0):
+        self._transform = transform if transform is not None else Matrix4x4()
+        self._scale = scale
+        self.parent = None
+        self.children = []
+        self.version = 0
+        self._world = None
+        self._normal = None
+
+    @property
+    def transform(self):
+        return self._transform
+
+    @transform.setter
+    def transform(self, matrix):
+        self._transform = matrix
+        self.invalidate()
+
+    @property
+    def scale(self):
+        return self._scale
+
+    @scale.setter
+    def scale(self, scale):
+        self._scale = scale
+        self.invalidate()
+
+    def invalidate(self):
+        # Матрица узла изменилась на месте или заменена: сбрасывается всё поддерево
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            node._world = None
+            node._normal = None
+            node.version += 1
+            stack.extend(node.children)
+
+    def set_children(self, nodes):
+        for child in self.children:
+            child.parent = None
+        self.children = list(nodes)
+        for child in self.children:
+            if child.parent is not None and child.parent is not self:
+                child.parent.children.remove(child)
+            child.parent = self
+            child.invalidate()
+
+    def local_matrix(self):
+        # Масштаб — множитель столбцов, как при умножении справа на diag(s, s, s, 1)
+        local = self._transform.to_array()
+        local[:, :3] *= self._scale
+        return local
+
+    @property
+    def world(self):
+        if self._world is None:
+            local = self.local_matrix()
+            self._world = local if self.parent is None else self.parent.world @ local
+        return self._world
+
+    @property
+    def normal_matrix(self):
+        # Обратная транспонированная к мировой 3×3: переводит нормали в мир и при неравномерном масштабе
+        if self._normal is None:
+            self._normal = np.linalg.inv(self.world[:3, :3]).T
+        return self._normal
+
+
 class Face:
     def __init__(self, vertices, color):
         self.vertices = vertices
@@ -145,26 +315,114 @@ class Face:
         return Vector3D(x, y, z)
 
 
-class Letter3D:
-    def __init__(self, height, width, depth, offset_x=0, letter_type='Д'):
-        self.height = height
-        self.width = width
-        self.depth = depth
-        self.offset_x = offset_x
-        self.letter_type = letter_type
-        self.vertices = []
-        self.faces = []
-        self.transform = Matrix4x4.rotation_x(180)
-        self.scale = 1.0
-        self.update_geometry()
+class Mesh:
+    # Индексированная сетка: уникальные вершины, индексы граней,
+    # нормали граней и смежность вершина -> грани.
+    # Рисуются фрагменты — грани или их части после разрезания BSP-деревом
+    def __init__(self, positions, face_indices):
+        self.positions = positions
+        self.vertex_count = len(positions)
+        self.face_indices = face_indices
+        self.vertex_array = np.hstack([positions, np.ones((len(positions), 1))])
+        self.face_normals = self.compute_face_normals()
+        self.vertex_face_offsets, self.vertex_face_list = self.build_adjacency()
+        # Нормали вершин зависят только от формы и пересчитываются вместе с геометрией
+        self.vertex_normals = self.compute_vertex_normals()
+        # Ограничивающая сфера по параллелепипеду вершин — для выбора уровня детализации
+        low, high = positions.min(axis=0), positions.max(axis=0)
+        self.center = (low + high) / 2
+        self.radius = float(np.linalg.norm(high - low)) / 2
+        self.bsp = None
+        self.set_fragments(face_indices.tolist(), np.arange(len(face_indices)))
 
-    def update_geometry(self):
+    @staticmethod
+    def from_faces(faces):
+        # Совпадающие по координатам вершины сливаются в одну
+        index = {}
+        positions = []
+        face_indices = []
+        for face in faces:
+            corners = []
+            for v in face.vertices:
+                key = (v.x, v.y, v.z)
+                if key not in index:
+                    index[key] = len(positions)
+                    positions.append(key)
+                corners.append(index[key])
+            face_indices.append(corners)
+        return Mesh(np.array(positions, dtype=float).reshape(-1, 3),
+                    np.array(face_indices, dtype=np.intp).reshape(len(face_indices), -1))
+
+    def compute_face_normals(self):
+        # Нормаль по первым трём вершинам, как в Face.calculate_normal
+        p0 = self.positions[self.face_indices[:, 0]]
+        p1 = self.positions[self.face_indices[:, 1]]
+        p2 = self.positions[self.face_indices[:, 2]]
+        normals = np.cross(p1 - p0, p2 - p0)
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        return np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+
+    def set_fragments(self, polygons, fragment_faces):
+        self.fragment_indices, self.fragment_lengths = pad_polygons(polygons)
+        self.fragment_lists = self.fragment_lists_of(self.fragment_indices, self.fragment_lengths)
+        self.fragment_faces = np.asarray(fragment_faces, dtype=np.intp)
+        self.triangles, self.triangle_fragments = fan_triangulate(self.fragment_indices, self.fragment_lengths)
+
+    @staticmethod
+    def fragment_lists_of(fragments, lengths):
+        # Фрагменты списками индексов без дополнения — для отрисовки через QPainter
+        return [row[:length] for row, length in zip(fragments.tolist(), lengths.tolist())]
+
+    def build_bsp(self):
+        # Дерево строится один раз на геометрию; вершины разрезов дописываются в конец сетки
+        self.attach_bsp(BSPTree(self.positions, self.face_indices.tolist(), self.face_normals,
+                                range(len(self.face_indices))))
+
+    def attach_bsp(self, tree):
+        # Готовое дерево (построенное или загруженное с диска) подключается к сетке
+        if tree.splits:
+            added = len(tree.splits)
+            self.positions = apply_splits(self.positions, tree.splits)
+            self.vertex_normals = apply_splits(self.vertex_normals, tree.splits, normalize=True)
+            self.vertex_array = np.hstack([self.positions, np.ones((len(self.positions), 1))])
+            self.vertex_face_offsets = np.concatenate(
+                [self.vertex_face_offsets, np.full(added, self.vertex_face_offsets[-1])])
+        self.set_fragments(tree.polygons, tree.tags)
+        self.bsp = tree
+
+    def build_adjacency(self):
+        # Смежность в сжатом виде: грани вершины i — vertex_face_list[offsets[i]:offsets[i + 1]]
+        face_count, corners = self.face_indices.shape
+        faces = np.repeat(np.arange(face_count), corners)
+        pairs = np.unique(np.column_stack([self.face_indices.ravel(), faces]), axis=0)
+        counts = np.bincount(pairs[:, 0], minlength=len(self.positions))
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        return offsets, pairs[:, 1]
+
+    def vertex_faces(self, vertex):
+        return self.vertex_face_list[self.vertex_face_offsets[vertex]:self.vertex_face_offsets[vertex + 1]]
+
+    def compute_vertex_normals(self):
+        # Среднее нормалей смежных граней; у изолированных вершин — (0, 0, 1)
+        counts = np.diff(self.vertex_face_offsets)
+        owners = np.repeat(np.arange(len(self.positions)), counts)
+        sums = np.zeros_like(self.positions)
+        np.add.at(sums, owners, self.face_normals[self.vertex_face_list])
+        lengths = np.linalg.norm(sums, axis=1, keepdims=True)
+        normals = np.divide(sums, lengths, out=np.zeros_like(sums), where=lengths > 0)
+        normals[counts == 0] = (0, 0, 1)
+        return normals
+
+
+class LetterOutline:
+    # Вершины и грани буквы при заданных параметрах; детали запоминаются для ориентации граней
+    def __init__(self, letter_type, h, w, d, ox):
         self.vertices = []
         self.faces = []
-        h, w, d, ox = self.height, self.width, self.depth, self.offset_x
+        self.parts = []
         bar_thickness = h * 0.1  # Толщина перекладин и стоек
 
-        if self.letter_type == 'Д':
+        if letter_type == 'Д':
             self.create_letter_D(h, w, d, ox, bar_thickness)
         else:
             self.create_letter_N(h, w, d, ox, bar_thickness)
@@ -338,10 +596,14 @@ class Letter3D:
         side_color = main_color
         top_color = main_color
 
+        # Грани детали ориентируются нормалью наружу от её центра уже в шаблоне
+        first_face = len(self.faces)
+
         # Передняя и задняя грани
-        self.faces.append(
-            Face([front_vertices[0], front_vertices[1], front_vertices[2], front_vertices[3]], main_color))
-        self.faces.append(Face([back_vertices[0], back_vertices[3], back_vertices[2], back_vertices[1]], main_color))
+        self.faces.append(Face([front_vertices[0], front_vertices[1], front_vertices[2], front_vertices[3]],
+                               main_color))
+        self.faces.append(Face([back_vertices[0], back_vertices[3], back_vertices[2], back_vertices[1]],
+                               main_color))
 
         # Боковые грани
         for i in range(len(front_vertices)):
@@ -352,21 +614,6 @@ class Letter3D:
                 back_vertices[next_i],
                 front_vertices[next_i]
             ]
-            v1 = side_face[1] - side_face[0]
-            v2 = side_face[2] - side_face[0]
-            normal = Vector3D(
-                v1.y * v2.z - v1.z * v2.y,
-                v1.z * v2.x - v1.x * v2.z,
-                v1.x * v2.y - v1.y * v2.x
-            ).normalized()
-            center = Vector3D(
-                sum(v.x for v in side_face) / 4,
-                sum(v.y for v in side_face) / 4,
-                sum(v.z for v in side_face) / 4
-            )
-            to_center = center * (-1)
-            if normal.dot(to_center) < 0:
-                side_face = [front_vertices[i], front_vertices[next_i], back_vertices[next_i], back_vertices[i]]
             self.faces.append(Face(side_face, side_color))
 
         # Верхняя и нижняя грани (если есть)
@@ -376,14 +623,257 @@ class Letter3D:
             self.faces.append(Face(top_face, top_color))
             self.faces.append(Face(bottom_face, top_color))
 
+        self.parts.append((first_face, len(self.faces), front_vertices + back_vertices))
+
+
+# Буквы с собственным параметрическим контуром; остальные символы строятся по шрифту
+LETTER_TYPES = ('Д', 'Н')
+
+
+class MeshTemplate:
+    # Топология буквы строится один раз: координаты вершин линейны по параметрам,
+    # positions = coefficients · (h, w, d, ox, 1). Сетки с нормалями и BSP-деревом
+    # запоминаются по набору параметров, чтобы возврат ползунка не строил их заново
+    templates = {}
+    cache_size = 64
+
+    def __init__(self, letter_type):
+        # Коэффициенты находятся по контурам в нуле и в единичных точках параметров
+        samples = [LetterOutline(letter_type, *point) for point in np.vstack([np.zeros(4), np.eye(4)]).tolist()]
+        raw = np.array([[(v.x, v.y, v.z) for v in sample.vertices] for sample in samples], dtype=float)
+        coefficients = np.concatenate([raw[1:] - raw[:1], raw[:1]])
+
+        # Вершины с одинаковыми коэффициентами совпадают при любых параметрах и сливаются
+        outline = samples[0]
+        raw_index = {id(v): i for i, v in enumerate(outline.vertices)}
+        index, order, faces = {}, [], []
+        for face in outline.faces:
+            corners = []
+            for v in face.vertices:
+                i = raw_index[id(v)]
+                key = tuple(np.round(coefficients[:, i], 9).ravel().tolist())
+                if key not in index:
+                    index[key] = len(order)
+                    order.append(i)
+                corners.append(index[key])
+            faces.append(corners)
+        unique = {i: index[tuple(np.round(coefficients[:, i], 9).ravel().tolist())]
+                  for i in range(len(outline.vertices))}
+
+        self.coefficients = coefficients[:, order]
+        self.face_indices = np.array(faces, dtype=np.intp)
+        self.face_parts = np.full(len(faces), -1, dtype=np.intp)
+        self.part_vertices = np.array([[unique[raw_index[id(v)]] for v in vertices]
+                                       for _, _, vertices in outline.parts], dtype=np.intp)
+        for part, (first_face, last_face, _) in enumerate(outline.parts):
+            self.face_parts[first_face:last_face] = part
+        self.meshes = OrderedDict()
+
+    @staticmethod
+    def supports(letter_type):
+        return letter_type in LETTER_TYPES
+
+    @classmethod
+    def for_letter(cls, letter_type):
+        if letter_type not in cls.templates:
+            cls.templates[letter_type] = MeshTemplate(letter_type)
+        return cls.templates[letter_type]
+
+    def positions(self, h, w, d, ox):
+        return np.tensordot(np.array([h, w, d, ox, 1.0]), self.coefficients, axes=1)
+
+    def oriented_faces(self, positions):
+        # Грани деталей разворачиваются, если нормаль смотрит внутрь детали
+        faces = self.face_indices.copy()
+        owned = np.flatnonzero(self.face_parts >= 0)
+        corners = positions[faces[owned]]
+        normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        part_centers = positions[self.part_vertices].mean(axis=1)
+        outward = corners.mean(axis=1) - part_centers[self.face_parts[owned]]
+        inward = owned[np.einsum('ij,ij->i', normals, outward) < 0]
+        faces[inward] = faces[inward, ::-1]
+        return faces
+
+    def mesh(self, h, w, d, ox):
+        key = (h, w, d, ox)
+        if key in self.meshes:
+            self.meshes.move_to_end(key)
+            return self.meshes[key]
+        positions = self.positions(h, w, d, ox)
+        mesh = Mesh(positions, self.oriented_faces(positions))
+        mesh.build_bsp()
+        self.meshes[key] = mesh
+        if len(self.meshes) > self.cache_size:
+            self.meshes.popitem(last=False)
+        return mesh
+
+
+# Версия формата файлов кэша глифов: меняется вместе с построителем сетки
+GLYPH_CACHE_VERSION = 1
+
+
+class GlyphMesh:
+    # Сетки остальных символов из контуров шрифта. Построение (спрямление кривых,
+    # триангуляция, выдавливание и BSP-дерево) дорогое, поэтому готовые сетки хранятся
+    # в памяти и в файлах по ключу (шрифт, символ, размер, глубина, допуск) и форме граней
+    meshes = OrderedDict()
+    cache_size = 256
+    cache_dir = os.path.join(QStandardPaths.writableLocation(QStandardPaths.GenericCacheLocation), 'lab2_glyphs')
+
+    @staticmethod
+    def supports(char):
+        return not char.isspace() and not glyph_path(char, glyph_font()).isEmpty()
+
+    @staticmethod
+    def unit_width(char):
+        # Ширина глифа при высоте прописной буквы 1
+        font = glyph_font()
+        return glyph_path(char, font).boundingRect().width() * glyph_scale(font, 1.0)
+
+    @staticmethod
+    def key(char, size, depth, font=None, tolerance=GLYPH_TOLERANCE, bevel=0.0, segments=0, offset_x=0.0):
+        font = font or glyph_font(size)
+        return (font.key(), char, round(float(size), 3), round(float(depth), 3), float(tolerance),
+                round(float(bevel), 3), int(segments), round(float(offset_x), 3))
+
+    @classmethod
+    def mesh(cls, char, size, depth, font=None, tolerance=GLYPH_TOLERANCE, bevel=0.0, segments=0, offset_x=0.0):
+        key = cls.key(char, size, depth, font, tolerance, bevel, segments, offset_x)
+        if key in cls.meshes:
+            cls.meshes.move_to_end(key)
+            return cls.meshes[key]
+        mesh = cls.load(key)
+        if mesh is None:
+            mesh = Mesh(*extrude_glyph(char, size, depth, font, tolerance, bevel, segments, offset_x))
+            mesh.build_bsp()
+            cls.save(key, mesh)
+        cls.meshes[key] = mesh
+        if len(cls.meshes) > cls.cache_size:
+            cls.meshes.popitem(last=False)
+        return mesh
+
+    @classmethod
+    def path(cls, key):
+        digest = hashlib.sha1(repr((GLYPH_CACHE_VERSION,) + key).encode('utf-8')).hexdigest()
+        return os.path.join(cls.cache_dir, f'{digest}.npz')
+
+    @classmethod
+    def load(cls, key):
+        path = cls.path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                state = {name: data[name] for name in data.files}
+            mesh = Mesh(state['positions'], state['face_indices'])
+            mesh.attach_bsp(BSPTree.from_state({name[4:]: value for name, value in state.items()
+                                                if name.startswith('bsp_')}))
+            return mesh
+        except (OSError, ValueError, KeyError, IndexError):
+            # Повреждённый или устаревший файл просто строится заново
+            return None
+
+    @classmethod
+    def save(cls, key, mesh):
+        # Запись через временный файл, чтобы прерванное сохранение не оставило битый кэш.
+        # Кэш на диске необязателен: ошибки записи не мешают отрисовке
+        path = cls.path(key)
+        temporary = f'{path}.tmp'
+        state = {f'bsp_{name}': value for name, value in mesh.bsp.state().items()}
+        try:
+            os.makedirs(cls.cache_dir, exist_ok=True)
+            with open(temporary, 'wb') as file:
+                np.savez(file, positions=mesh.positions[:mesh.vertex_count], face_indices=mesh.face_indices, **state)
+            os.replace(temporary, path)
+        except OSError:
+            pass
+
+
+class Letter3D:
+    def __init__(self, height, width, depth, offset_x=0, letter_type='Д', style=LetterStyle.FLAT):
+        self.height = height
+        self.width = width
+        self.depth = depth
+        self.offset_x = offset_x
+        self.letter_type = letter_type
+        self.style = style
+        self.mesh = None
+        self.levels = []
+        self.level = None
+        # Поворот, перенос и масштаб буквы хранит её узел графа сцены
+        self.node = SceneNode(Matrix4x4.rotation_x(180))
+        self.update_geometry()
+
+    @property
+    def transform(self):
+        return self.node.transform
+
+    @transform.setter
+    def transform(self, matrix):
+        self.node.transform = matrix
+
+    @property
+    def scale(self):
+        return self.node.scale
+
+    @scale.setter
+    def scale(self, scale):
+        self.node.scale = scale
+
+    def update_geometry(self):
+        # Уровни детализации строятся по запросу: далёкая буква не строит подробную сетку.
+        # Новая буква начинает с самого грубого уровня, сцена уточнит его по размеру на экране
+        self.levels = [None] * self.level_count()
+        last = len(self.levels) - 1
+        self.set_level(last if self.level is None else min(self.level, last))
+
+    def level_count(self):
+        if self.style == LetterStyle.FLAT and MeshTemplate.supports(self.letter_type):
+            return 1
+        return len(DETAIL_LEVELS[self.style])
+
+    def set_level(self, level):
+        self.level = level
+        if self.levels[level] is None:
+            self.levels[level] = self.build_level(level)
+        self.mesh = self.levels[level]
+
+    def build_level(self, level):
+        if self.style == LetterStyle.FLAT and MeshTemplate.supports(self.letter_type):
+            # Топология берётся из общего шаблона, по параметрам меняются только координаты
+            template = MeshTemplate.for_letter(self.letter_type)
+            return template.mesh(self.height, self.width, self.depth, self.offset_x)
+        # Остальные символы и буквы с фаской строятся по шрифту: пропорции задаёт сам глиф
+        factor, segments = DETAIL_LEVELS[self.style][level]
+        bevel = self.height * BEVEL_RATIO if segments else 0.0
+        return GlyphMesh.mesh(self.letter_type, self.height, self.depth, tolerance=GLYPH_TOLERANCE * factor,
+                              bevel=bevel, segments=segments, offset_x=self.offset_x)
+
+    @staticmethod
+    def supports(letter_type):
+        return MeshTemplate.supports(letter_type) or GlyphMesh.supports(letter_type)
+
+    @staticmethod
+    def unit_width(letter_type, style=LetterStyle.FLAT):
+        # Ширина буквы при высоте 1 и пропорциях по умолчанию — для шага текста
+        if style == LetterStyle.FLAT and MeshTemplate.supports(letter_type):
+            return float(np.ptp(MeshTemplate.for_letter(letter_type).positions(1.0, 0.6, 0.3, 0)[:, 0]))
+        return GlyphMesh.unit_width(letter_type)
+
+    @property
+    def vertices(self):
+        return [Vector3D(x, y, z) for x, y, z in self.mesh.positions[:self.mesh.vertex_count].tolist()]
+
+    @property
+    def faces(self):
+        # Грани в виде Face строятся по запросу из индексированной сетки
+        vertices = self.vertices
+        main_color = QColor(255, 105, 180)
+        return [Face([vertices[i] for i in corners], main_color) for corners in self.mesh.face_indices.tolist()]
+
     def rotate(self, axis, angle):
-        if axis == 0:
-            rot = Matrix4x4.rotation_x(angle)
-        elif axis == 1:
-            rot = Matrix4x4.rotation_y(angle)
-        else:
-            rot = Matrix4x4.rotation_z(angle)
-        self.transform = rot * self.transform
+        self.transform.premultiply(Matrix4x4.rotation(axis, angle))
+        self.node.invalidate()
 
     def set_scale(self, scale_factor):
         self.scale = scale_factor
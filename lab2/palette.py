@@ -0,0 +1,40 @@
+import numpy as np
+from PySide6.QtGui import QBrush, QColor, QPen
+
+SHADE_STEPS = 255  # ступеней интенсивности на единицу яркости
+EDGE_DARKENING = 0.7  # край градиента Фонга темнее центра
+
+
+class ShadeTable:
+    # Оттенки одного базового цвета: интенсивность квантуется с шагом 1 / SHADE_STEPS,
+    # и для каждой ступени один раз создаются цвет, кисть и перо. Таблица доходит
+    # до яркости, при которой все каналы упираются в 255, дальше ступень ограничивается
+    tables = {}
+
+    def __init__(self, base_color):
+        self.base_color = tuple(base_color)
+        base = np.array(base_color, dtype=float)
+        weakest = base[base > 0].min() if (base > 0).any() else 255.0
+        count = int(np.ceil(SHADE_STEPS * 255 / weakest)) + 1
+        steps = np.arange(count) / SHADE_STEPS
+        rgb = np.minimum(255, (base[None, :] * steps[:, None]).astype(int))
+        self.colors = [QColor(r, g, b) for r, g, b in rgb.tolist()]
+        self.edge_colors = [QColor(*(int(channel * EDGE_DARKENING) for channel in color))
+                            for color in rgb.tolist()]
+        self.brushes = [QBrush(color) for color in self.colors]
+        self.pens = [QPen(color, 1) for color in self.colors]
+
+    @classmethod
+    def for_color(cls, base_color):
+        key = tuple(base_color)
+        if key not in cls.tables:
+            cls.tables[key] = ShadeTable(key)
+        return cls.tables[key]
+
+    def levels(self, intensities):
+        # Номера ступеней для массива интенсивностей
+        levels = (np.asarray(intensities, dtype=float) * SHADE_STEPS).astype(int)
+        return np.clip(levels, 0, len(self.colors) - 1)
+
+    def level(self, intensity):
+        return min(max(int(intensity * SHADE_STEPS), 0), len(self.colors) - 1)
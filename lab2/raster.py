@@ -0,0 +1,218 @@
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from PySide6.QtGui import QImage
+from enum import Enum
+
+FRAGMENT_CHUNK = 1 << 18  # пикселей описывающих прямоугольников в одном проходе растеризации
+NO_FRAGMENT = np.iinfo(np.intp).max
+
+
+class RenderBackend(Enum):
+    PAINTER = "QPainter"
+    RASTER = "Z-буфер"
+
+
+class Rasterizer:
+    # Программная растеризация треугольников в буферы цвета и глубины NumPy.
+    # Кадр делится на плитки, треугольники раскладываются по плиткам,
+    # плитки закрашиваются параллельно в пуле потоков (NumPy отпускает GIL)
+    def __init__(self, tile_size=128, workers=None):
+        self.width = 0
+        self.height = 0
+        self.color_buffer = None
+        self.depth_buffer = None
+        self.image = None
+        self.tile_size = tile_size
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = ThreadPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        self.batches = []
+
+    def resize(self, width, height):
+        if (width, height) == (self.width, self.height):
+            return
+        self.width = width
+        self.height = height
+        # Порядок байт B, G, R, A соответствует QImage.Format_RGB32
+        self.color_buffer = np.zeros((height, width, 4), dtype=np.uint8)
+        # В буфере глубины хранится 1/z: 0 — бесконечно далеко, больше — ближе
+        self.depth_buffer = np.zeros((height, width), dtype=np.float32)
+        # Номер первого фрагмента с наибольшим 1/z в пикселе при тесте глубины; вне теста — NO_FRAGMENT.
+        # Плитки не пересекаются, поэтому потоки делят один массив
+        self.first_fragment = np.full(height * width, NO_FRAGMENT, dtype=np.intp)
+        # QImage смотрит прямо в буфер цвета, без копирования
+        self.image = QImage(self.color_buffer.data, width, height, width * 4, QImage.Format_RGB32)
+
+    def clear(self, color):
+        r, g, b = color
+        # Пиксель B, G, R, A пишется одним 32-битным словом
+        self.color_buffer.view(np.uint32).fill(np.array([b, g, r, 255], dtype=np.uint8).view(np.uint32)[0])
+        self.depth_buffer.fill(0)
+        self.batches = []
+
+    def draw_triangles(self, screen, depths, triangles, attributes, shade):
+        # screen — экранные координаты вершин (N×2), depths — глубина в системе камеры (N),
+        # triangles — индексы вершин (T×3), attributes — интерполируемые атрибуты (N×K).
+        # shade(attrs, t) возвращает цвета RGB (P×3) для фрагментов, t — номера их треугольников (P).
+        # Треугольники копятся до flush()
+        inv_z = 1.0 / depths
+        # Координаты углов — строками (3×T): дальше всё считается на непрерывных массивах
+        x0, x1, x2 = np.take(screen[:, 0], triangles.T)
+        y0, y1, y2 = np.take(screen[:, 1], triangles.T)
+        area = (x1 - x0) * (y2 - y0) - (x2 - x0) * (y1 - y0)
+        # Подготовка треугольников разом для всего пакета: вырожденные, не накрывающие ни одного
+        # центра пикселя и целиком за краем кадра отбрасываются, описывающие прямоугольники
+        # (по центрам пикселей i + 0.5) обрезаются по кадру
+        with np.errstate(invalid='ignore'):
+            boxes = [np.ceil(np.minimum(np.minimum(x0, x1), x2) - 0.5),
+                     np.ceil(np.minimum(np.minimum(y0, y1), y2) - 0.5),
+                     np.floor(np.maximum(np.maximum(x0, x1), x2) - 0.5),
+                     np.floor(np.maximum(np.maximum(y0, y1), y2) - 0.5)]
+            keep = (np.abs(area) >= 1e-9) & (boxes[0] <= boxes[2]) & (boxes[1] <= boxes[3]) & \
+                (boxes[0] <= self.width - 1) & (boxes[1] <= self.height - 1) & (boxes[2] >= 0) & (boxes[3] >= 0)
+        # Дальше пакет хранит только оставшиеся треугольники; kept — их номера в исходном пакете
+        kept = np.flatnonzero(keep)
+        x0, x1, x2, y0, y1, y2, area = (values[kept] for values in (x0, x1, x2, y0, y1, y2, area))
+        triangles = triangles[kept]
+        limits = [self.width - 1, self.height - 1] * 2
+        # Барицентрические координаты — линейные функции экрана: w = c + a·x + b·y, коэффициенты
+        # двух первых (уже делённые на площадь) считаются один раз на треугольник
+        edges = np.column_stack([x1 * y2 - x2 * y1, y1 - y2, x2 - x1,
+                                 x2 * y0 - x0 * y2, y2 - y0, x0 - x2]) / area[:, None]
+        self.batches.append({
+            'inv_z': np.take(inv_z, triangles),
+            # Атрибуты интерполируются с учётом перспективы: a/z линейно на экране
+            'weighted': attributes * inv_z[:, None],
+            'triangles': triangles,
+            'edges': edges,
+            'kept': kept,
+            'boxes': np.column_stack([np.clip(bound[kept], 0, limit).astype(np.intp)
+                                      for bound, limit in zip(boxes, limits)]),
+            'shade': shade,
+        })
+
+    def flush(self):
+        tiles = self.bin_triangles()
+        if self.pool is not None and len(tiles) > 1:
+            # Плитки не пересекаются, поэтому пишут в общие буферы без блокировок
+            for future in [self.pool.submit(self.rasterize_tile, *tile) for tile in tiles]:
+                future.result()
+        else:
+            for tile in tiles:
+                self.rasterize_tile(*tile)
+        self.batches = []
+
+    @staticmethod
+    def expand_ranges(counts):
+        # Для отрезков длиной counts: номер отрезка и номер элемента внутри него для каждого элемента
+        owner = np.repeat(np.arange(len(counts)), counts)
+        starts = np.cumsum(counts) - counts
+        return owner, np.arange(int(counts.sum())) - starts[owner]
+
+    def bin_triangles(self):
+        # Раскладка треугольников по плиткам, которые задевает их описывающий прямоугольник:
+        # пары (плитка, пакет, треугольник) строятся массивами и сортируются по плитке устойчиво,
+        # так что внутри плитки сохраняется порядок пакетов и треугольников
+        size = self.tile_size
+        tiles_x = (self.width + size - 1) // size
+        tile_ids, batch_ids, triangle_ids = [], [], []
+        for batch_index, batch in enumerate(self.batches):
+            if len(batch['kept']) == 0:
+                continue
+            tile_lo, tile_hi = batch['boxes'][:, :2] // size, batch['boxes'][:, 2:] // size
+            spans = tile_hi - tile_lo + 1
+            owner, local = self.expand_ranges(spans[:, 0] * spans[:, 1])
+            tile_x = tile_lo[owner, 0] + local % spans[owner, 0]
+            tile_y = tile_lo[owner, 1] + local // spans[owner, 0]
+            tile_ids.append(tile_y * tiles_x + tile_x)
+            batch_ids.append(np.full(len(owner), batch_index))
+            triangle_ids.append(owner)
+        if not tile_ids:
+            return []
+        tile_ids = np.concatenate(tile_ids)
+        order = np.argsort(tile_ids, kind='stable')
+        tile_ids, batch_ids, triangle_ids = tile_ids[order], np.concatenate(batch_ids)[order], \
+            np.concatenate(triangle_ids)[order]
+
+        tiles = []
+        bounds = np.flatnonzero(np.diff(tile_ids)) + 1
+        for start, end in zip([0] + bounds.tolist(), bounds.tolist() + [len(tile_ids)]):
+            tile = int(tile_ids[start])
+            x0, y0 = tile % tiles_x * size, tile // tiles_x * size
+            x1 = min(x0 + size, self.width) - 1
+            y1 = min(y0 + size, self.height) - 1
+            batch_bounds = np.flatnonzero(np.diff(batch_ids[start:end])) + 1 + start
+            batches = [(int(batch_ids[first]), triangle_ids[first:last])
+                       for first, last in zip([start] + batch_bounds.tolist(), batch_bounds.tolist() + [end])]
+            tiles.append((x0, y0, x1, y1, batches))
+        return tiles
+
+    def rasterize_tile(self, tile_x0, tile_y0, tile_x1, tile_y1, batches):
+        for batch_index, triangles in batches:
+            self.rasterize_batch(self.batches[batch_index], triangles, tile_x0, tile_y0, tile_x1, tile_y1)
+
+    def rasterize_batch(self, batch, triangles, clip_x0, clip_y0, clip_x1, clip_y1):
+        # Все треугольники пакета в плитке за один проход: пиксели их описывающих прямоугольников
+        # разворачиваются в общий массив фрагментов. Чтобы массивы не разрастались на больших
+        # треугольниках, пакет режется на части не больше FRAGMENT_CHUNK пикселей (часть — хотя бы
+        # один треугольник); части идут по порядку, поэтому результат тот же
+        boxes = batch['boxes'][triangles]
+        x_min, y_min = np.maximum(boxes[:, 0], clip_x0), np.maximum(boxes[:, 1], clip_y0)
+        widths = np.maximum(np.minimum(boxes[:, 2], clip_x1) - x_min + 1, 0)
+        counts = widths * np.maximum(np.minimum(boxes[:, 3], clip_y1) - y_min + 1, 0)
+        parts = np.cumsum(counts) // FRAGMENT_CHUNK
+        bounds = (np.flatnonzero(np.diff(parts)) + 1).tolist()
+        for start, end in zip([0] + bounds, bounds + [len(triangles)]):
+            self.rasterize_part(batch, triangles[start:end], x_min[start:end], y_min[start:end],
+                                widths[start:end], counts[start:end])
+
+    def rasterize_part(self, batch, triangles, x_min, y_min, widths, counts):
+        owner, local = self.expand_ranges(counts)
+        if len(owner) == 0:
+            return
+        # Данные треугольников берутся строками через take: это заметно быстрее индексации массивом
+        widths = widths[owner]
+        cols = x_min[owner] + local % widths
+        rows = y_min[owner] + local // widths
+        triangles = triangles[owner]
+
+        # Барицентрические координаты центров пикселей
+        edges = np.take(batch['edges'], triangles, axis=0)
+        xs, ys = cols + 0.5, rows + 0.5
+        w0 = edges[:, 0] + edges[:, 1] * xs + edges[:, 2] * ys
+        w1 = edges[:, 3] + edges[:, 4] * xs + edges[:, 5] * ys
+        w2 = 1.0 - w0 - w1
+        inside = np.flatnonzero((w0 >= 0) & (w1 >= 0) & (w2 >= 0))
+        if len(inside) == 0:
+            return
+        rows, cols, triangles = rows[inside], cols[inside], triangles[inside]
+        b0, b1, b2 = w0[inside], w1[inside], w2[inside]
+        inv_z = np.take(batch['inv_z'], triangles, axis=0)
+        z = b0 * inv_z[:, 0] + b1 * inv_z[:, 1] + b2 * inv_z[:, 2]
+
+        # Тест глубины без цикла по фрагментам. Последовательно фрагмент проходит, если он строго
+        # ближе всех прежних фрагментов пикселя и значения в буфере, поэтому последним прошедшим
+        # оказывается первый по порядку фрагмент с наибольшим 1/z, а в буфер попадает этот максимум.
+        # Максимум пишется в буфер через maximum.at, первый фрагмент с ним ищется через minimum.at.
+        # Глубины сравниваются в точности буфера (float32), как при записи по одному фрагменту
+        pixels = rows * self.width + cols
+        depth = z.astype(self.depth_buffer.dtype)
+        buffer = self.depth_buffer.reshape(-1)
+        previous = buffer[pixels]
+        np.maximum.at(buffer, pixels, depth)
+        candidates = np.flatnonzero((depth > previous) & (depth == buffer[pixels]))
+        if len(candidates) == 0:
+            return
+        candidate_pixels = pixels[candidates]
+        np.minimum.at(self.first_fragment, candidate_pixels, candidates)
+        # Цвет нужен только победителю каждого пикселя
+        shown = candidates[self.first_fragment[candidate_pixels] == candidates]
+        self.first_fragment[candidate_pixels] = NO_FRAGMENT
+
+        vertices = np.take(batch['triangles'], triangles[shown], axis=0)
+        weighted = batch['weighted']
+        attrs = (b0[shown, None] * np.take(weighted, vertices[:, 0], axis=0) +
+                 b1[shown, None] * np.take(weighted, vertices[:, 1], axis=0) +
+                 b2[shown, None] * np.take(weighted, vertices[:, 2], axis=0)) / z[shown, None]
+        colors = np.clip(batch['shade'](attrs, batch['kept'][triangles[shown]]), 0, 255).astype(np.uint8)
+        self.color_buffer[rows[shown], cols[shown], :3] = colors[:, ::-1]
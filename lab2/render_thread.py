@@ -0,0 +1,98 @@
+import logging
+import time
+from PySide6.QtCore import QMutex, QMutexLocker, QRectF, QThread, QWaitCondition, Signal
+from PySide6.QtGui import QImage
+
+SUPERSEDE_WINDOW_MS = 100  # кадр в работе отменяется новым запросом, только если показанный кадр свежее этого срока
+
+log = logging.getLogger(__name__)
+
+
+class FrameSuperseded(Exception):
+    # Пока рисовался кадр, пришло новое состояние сцены
+    pass
+
+
+class RenderThread(QThread):
+    # Отрисовка сцены в фоновом потоке с двумя буферами: поток рисует в задний QImage,
+    # готовый кадр меняется местами с передним, а виджет только копирует передний на экран.
+    # Запросы не копятся: поток всегда рисует последнее состояние. Устаревший кадр в работе
+    # бросается между этапами, но если новые запросы идут непрерывно, он всё же дорисовывается,
+    # чтобы изображение не застывало. Вместе с готовым кадром передаётся перерисованный
+    # прямоугольник (None — весь кадр): поверх прошлого кадра дорисовывается только он
+    frame_ready = Signal(object)
+
+    def __init__(self, render_frame):
+        super().__init__()
+        self.render_frame = render_frame
+        self.mutex = QMutex()
+        self.condition = QWaitCondition()
+        self.requested = 0
+        self.generation = 0
+        self.size = None
+        self.front = None
+        self.back = None
+        self.published_at = 0.0
+        self.running = True
+        self.stats = {'requested': 0, 'rendered': 0, 'superseded': 0, 'errors': 0}
+
+    def request(self, size):
+        with QMutexLocker(self.mutex):
+            self.requested += 1
+            self.size = size
+            self.stats['requested'] += 1
+            self.condition.wakeOne()
+
+    def check_superseded(self):
+        # Вызывается потоком отрисовки между этапами кадра
+        if self.requested != self.generation and \
+                (time.perf_counter() - self.published_at) * 1000 < SUPERSEDE_WINDOW_MS:
+            raise FrameSuperseded
+
+    def blit(self, painter, rect):
+        # Копирует последний готовый кадр; возвращает его размер или None, если кадров ещё не было
+        with QMutexLocker(self.mutex):
+            if self.front is None:
+                return None
+            if self.front.size() == rect.size():
+                painter.drawImage(rect.topLeft(), self.front)
+            else:
+                painter.drawImage(QRectF(rect), self.front)
+            return self.front.size()
+
+    def run(self):
+        while True:
+            with QMutexLocker(self.mutex):
+                while self.running and self.requested == self.generation:
+                    self.condition.wait(self.mutex)
+                if not self.running:
+                    return
+                self.generation = self.requested
+                size = self.size
+            if size.isEmpty():
+                # Виджет ещё не уложен в окно: рисовать некуда, кадр запросят после изменения размера
+                continue
+            if self.back is None or self.back.size() != size:
+                self.back = QImage(size, QImage.Format_RGB32)
+            try:
+                dirty = self.render_frame(self.back, self.front)
+            except FrameSuperseded:
+                self.stats['superseded'] += 1
+                continue
+            except Exception:
+                # Ошибка в кадре не останавливает поток: на экране остаётся прошлый кадр,
+                # следующий запрос рисуется заново
+                log.exception('frame rendering failed')
+                self.stats['errors'] += 1
+                continue
+            with QMutexLocker(self.mutex):
+                self.front, self.back = self.back, self.front
+                self.published_at = time.perf_counter()
+                self.stats['rendered'] += 1
+            self.frame_ready.emit(dirty)
+
+    def stop(self):
+        with QMutexLocker(self.mutex):
+            self.running = False
+            self.condition.wakeOne()
+        self.wait()
@@ -1,7 +1,47 @@
+import cProfile
+import threading
+import time
+from collections import deque
+import numpy as np
 from PySide6.QtWidgets import QWidget
-from PySide6.QtGui import QPainter, QPen, QBrush, QColor, QPolygonF, QLinearGradient, QRadialGradient, QImage
-from PySide6.QtCore import Qt, QPoint, QPointF
-from letters import Letter3D, Vector3D, Matrix4x4, ShadingMode
+from PySide6.QtGui import QPainter, QPen, QBrush, QColor, QPolygonF, QLinearGradient, QRadialGradient, QImage, \
+    QFont, QKeySequence, QShortcut
+from PySide6.QtCore import Qt, QCoreApplication, QPoint, QPointF, QRect, QRectF, QSize, QTimer
+from letters import Letter3D, LetterStyle, Mesh, SceneNode, Vector3D, Matrix4x4, ShadingMode
+from raster import Rasterizer, RenderBackend
+from bsp import BSPTree, apply_splits, pad_polygons, fan_triangulate, separate_boxes
+from palette import ShadeTable
+from render_thread import RenderThread
+
+# Этапы кэша кадра, у каждого свой флаг
+STAGE_GEOMETRY = 'geometry'      # сетки, мировые матрицы букв и BSP-разбиение сцены
+STAGE_TRANSFORM = 'transform'    # перевод в систему камеры и проекция на экран
+STAGE_ORDER = 'order'            # порядок отрисовки фрагментов обходом BSP-деревьев
+STAGE_LIGHTING = 'lighting'      # интенсивности освещения в вершинах
+ALL_STAGES = (STAGE_GEOMETRY, STAGE_TRANSFORM, STAGE_ORDER, STAGE_LIGHTING)
+
+FRAME_INTERVAL_MS = 16           # шаг планировщика кадров, ~60 кадров в секунду
+TURNTABLE_FPS = 30               # целевая частота кадров режима вращения по кругу
+TURNTABLE_SPEED = 30.0           # скорость вращения сцены вокруг её центра, градусов в секунду
+QUALITY_COOLDOWN = 10            # кадров после смены качества до следующей оценки
+PROFILE_STAGES = ('geometry', 'transform', 'lighting', 'order', 'draw')
+PROFILE_HISTORY = 240            # кадров в истории времени кадра для процентилей
+PROFILE_FRAMES = 60              # кадров в одном снимке cProfile
+INTERACTION_IDLE_MS = 250        # пауза во вводе, после которой кадр перерисовывается в полном качестве
+TEXT_WIDTH = 480                 # ширина и высота области, в которую раскладывается текст
+TEXT_HEIGHT = 360
+DETAIL_SIZES = (240, 100, 40)    # экранный размер буквы в пикселях, ниже которого берётся следующий уровень детализации
+DETAIL_HYSTERESIS = 0.2          # запас вокруг порогов, чтобы уровень не мигал на границе
+PAINT_CHUNK = 512                # команд рисования между проверками, не устарел ли кадр
+DIRTY_MARGIN = 2                 # запас экранной рамки буквы на сглаживание краёв, пикселей
+RASTER_LETTERS = 100             # от стольких букв кадр растеризуется, даже если выбран QPainter
+VIEW_UPDATES = {'rotate', 'scale', 'camera', 'light', 'mirror', 'turntable', 'reset'}  # изменения, которые затирает сброс вида
+
+# Рёбра вершин отсечения (a, b, t), когда отсекать нечего
+NO_CLIP_EDGES = (np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp), np.zeros(0))
+
+BACKGROUND_COLOR = (35, 35, 35)
+BASE_COLOR = (255, 105, 180)
 
 
 class SceneWidget(QWidget):
@@ -13,9 +53,24 @@ class SceneWidget(QWidget):
         self.setPalette(p)
         self.d_letter = Letter3D(100, 60, 30, offset_x=-60, letter_type='Д')
         self.n_letter = Letter3D(100, 60, 30, offset_x=60, letter_type='Н')
+        # Корень графа сцены несёт зеркальное отражение, буквы — его потомки
+        self.root = SceneNode()
+        self.letters = [self.d_letter, self.n_letter]
+        self.root.set_children(letter.node for letter in self.letters)
+        # Над корнем — узел вращения по кругу: поворачивает всю сцену вокруг её центра (начала
+        # координат), так что камера видит буквы с разных сторон, а не поворачивается на месте
+        self.turntable_node = SceneNode()
+        self.turntable_node.set_children([self.root])
+        self.turntable_angle = 0.0
+        self.text = ''
+        self.letter_style = LetterStyle.FLAT
         self.camera_pos = Vector3D(0, 0, -400)
         self.camera_rot = [0, 0, 0]
-        self.object_transform = Matrix4x4()
+        self.camera_key = None
+        self.camera_cached = None
+        # Положение камеры в системе каждой буквы и лицевые грани: пересчитываются только
+        # для букв, у которых сменились узел, сетка или положение камеры
+        self.facing_cache = {}
         self.scale = 1.0
         self.base_scale = 2.0
         self.auto_scale = True
@@ -26,91 +81,386 @@ class SceneWidget(QWidget):
         self.mirror_y = False
         self.mirror_z = False
         self.cached_faces = None
-        self.cache_valid = False
+        self.letter_frames = []
+        self.scene_tree = None
+        self.frame_groups = []
+        self.draw_order = []
+        self.vertex_intensities = []
+        # Интенсивности граней для однотонной заливки (по букве: массив и ступени таблицы оттенков);
+        # None — пересчитать при следующей отрисовке
+        self.face_lighting = None
+        # Готовые команды рисования QPainter: (многоугольник, перо, кисть). Собираются заново,
+        # только когда меняется список граней, освещение или режим заливки
+        self.paint_commands = []
+        self.paint_key = None
+        # Рамки команд рисования на экране (x0, y0, x1, y1) для частичной перерисовки
+        self.paint_boxes = None
+        self.paint_boxes_key = None
+        # Экранные рамки букв последнего готового кадра: (ключ кадра, {буква: ((версия узла, сетка, фрагменты), рамка)}).
+        # Если с тех пор поменялись только отдельные буквы, перерисовываются лишь их рамки
+        self.letter_boxes = None
+        self.pending_boxes = None
+        self.draw_list_version = 0
+        self.lighting_version = 0
+        self.shade_table = ShadeTable.for_color(BASE_COLOR)
+        self.background_color = QColor(*BACKGROUND_COLOR)
+        self.no_pen = QPen(Qt.NoPen)
+        self.dirty_stages = set(ALL_STAGES)
+        self.cull_stats = {'faces': 0, 'backface': 0, 'frustum': 0, 'visible': 0}
+        self.near_plane = 1.0
+        self.render_backend = RenderBackend.PAINTER
+        self.rasterizer = Rasterizer()
+
+        # Планировщик кадров: изменения от ползунков и кнопок копятся и применяются раз в кадр
+        self.pending_updates = []
+        self.pending_lock = threading.Lock()
+        self.update_stats = {'scheduled': 0, 'coalesced': 0, 'dropped': 0, 'frames': 0}
+        self.last_tick = None
+        self.frame_timer = QTimer(self)
+        self.frame_timer.setInterval(FRAME_INTERVAL_MS)
+        self.frame_timer.timeout.connect(self.frame_tick)
+
+        # Профилировщик: оверлей (F3) и снимок cProfile следующих кадров (F12)
+        self.show_profiler = False
+        self.stage_times = dict.fromkeys(PROFILE_STAGES, 0.0)
+        self.frame_history = deque(maxlen=PROFILE_HISTORY)
+        self.profiler = None
+        self.profiled_frames = 0
+        self.profile_path = None
+        QShortcut(QKeySequence(Qt.Key_F3), self, self.toggle_profiler)
+        QShortcut(QKeySequence(Qt.Key_F12), self, self.capture_profile)
+
+        # Во время перетаскивания кадры упрощённые; после паузы — один кадр в полном качестве
+        self.interactive = False
+        self.interactive_resolution = 0.5
+        self.low_res_image = None
+        self.low_res_valid = False
+        self.idle_timer = QTimer(self)
+        self.idle_timer.setSingleShot(True)
+        self.idle_timer.setInterval(INTERACTION_IDLE_MS)
+        self.idle_timer.timeout.connect(self.end_interaction)
+
+        # Вращение по кругу с бюджетом времени кадра и адаптивным качеством
+        self.turntable = False
+        self.turntable_last = None
+        self.turntable_timer = QTimer(self)
+        self.turntable_timer.setInterval(1000 // TURNTABLE_FPS)
+        self.turntable_timer.timeout.connect(self.turntable_tick)
+        self.quality_level = 0
+        self.quality_cooldown = 0
+        self.upgrade_wait = 0
+        self.upgrade_backoff = 1
+        self.last_quality_step = None
+        self.frame_time = 0.0
+        self.frame_time_average = None
+
+        # Фоновая отрисовка (start_render_thread). Поток держит state_lock весь кадр, поэтому
+        # изменения из интерфейса идут через очередь и применяются им же в начале кадра
+        self.render_thread = None
+        self.state_lock = threading.RLock()
+
+    def invalidate_cache(self, *stages):
+        # Без аргументов сбрасываются все этапы
+        stages = stages or ALL_STAGES
+        self.dirty_stages.update(stages)
+        if STAGE_GEOMETRY in stages or STAGE_LIGHTING in stages:
+            self.face_lighting = None
+
+    def schedule_update(self, key, value, apply, stages, accumulate=False, interactive=True):
+        # Новое значение заменяет ожидающее с тем же ключом. Приращения (повороты, ключ
+        # (вид, объект, ось)) складываются с последним поворотом того же объекта, только если
+        # он вокруг той же оси, — порядок поворотов вокруг разных осей сохраняется.
+        # interactive=False — разовое изменение (кнопка), кадр сразу в полном качестве
+        self.update_stats['scheduled'] += 1
+        with self.pending_lock:
+            if accumulate:
+                last = next((entry for entry in reversed(self.pending_updates) if entry[0][:-1] == key[:-1]), None)
+                if last is not None and last[0] == key:
+                    last[1] += value
+                    self.update_stats['coalesced'] += 1
+                else:
+                    self.pending_updates.append([key, value, apply, stages])
+            else:
+                for entry in self.pending_updates:
+                    if entry[0] == key:
+                        entry[1] = value
+                        self.update_stats['coalesced'] += 1
+                        break
+                else:
+                    self.pending_updates.append([key, value, apply, stages])
+        if not self.frame_timer.isActive():
+            self.last_tick = time.perf_counter()
+            self.frame_timer.start()
+        if interactive:
+            self.begin_interaction()
+
+    def begin_interaction(self):
+        # Вращение по кругу управляет качеством само, упрощённый режим ему не нужен.
+        # Режим читает поток отрисовки, поэтому он меняется через очередь; пока идёт
+        # таймер паузы, упрощённый режим уже заказан
+        if self.turntable_timer.isActive():
+            return
+        if not self.idle_timer.isActive():
+            self.schedule_update(('interactive',), True, self.apply_interactive, (), interactive=False)
+        self.idle_timer.start()
+
+    def end_interaction(self):
+        # Очередь сама заказывает кадр, он рисуется в полном качестве
+        self.idle_timer.stop()
+        self.schedule_update(('interactive',), False, self.apply_interactive, (), interactive=False)
+
+    def apply_interactive(self, interactive):
+        self.interactive = interactive
+
+    def apply_pending_updates(self):
+        with self.pending_lock:
+            updates, self.pending_updates = self.pending_updates, []
+        for key, value, apply, stages in updates:
+            apply(value)
+            if stages:
+                self.invalidate_cache(*stages)
+        return bool(updates)
+
+    def discard_pending_updates(self, kinds=None):
+        # kinds — виды изменений (первый элемент ключа), которые выбрасываются; None — все
+        with self.pending_lock:
+            self.pending_updates = [] if kinds is None else \
+                [entry for entry in self.pending_updates if entry[0][0] not in kinds]
+
+    def frame_tick(self):
+        # Пропущенные из-за долгого кадра такты считаются потерянными кадрами
+        now = time.perf_counter()
+        missed = int((now - self.last_tick) * 1000 / FRAME_INTERVAL_MS) - 1
+        self.update_stats['dropped'] += max(0, missed)
+        self.last_tick = now
+        # С фоновым потоком изменения применяет он сам в начале кадра
+        if self.render_thread is not None and self.pending_updates:
+            self.update_stats['frames'] += 1
+            self.request_frame()
+        elif self.render_thread is None and self.apply_pending_updates():
+            self.update_stats['frames'] += 1
+            self.update()
+        else:
+            self.frame_timer.stop()
+
+    def request_frame(self):
+        if self.render_thread is not None:
+            self.render_thread.request(self.size())
+        else:
+            self.update()
+
+    def start_render_thread(self):
+        # Кадры рисуются в фоне, paintEvent только копирует последний готовый
+        if self.render_thread is not None:
+            return
+        self.render_thread = RenderThread(self.render_frame)
+        self.render_thread.frame_ready.connect(self.show_frame)
+        QCoreApplication.instance().aboutToQuit.connect(self.stop_render_thread)
+        self.render_thread.start()
+        self.request_frame()
+
+    def stop_render_thread(self):
+        if self.render_thread is not None:
+            self.render_thread.stop()
+            self.render_thread = None
+
+    def check_superseded(self):
+        if self.render_thread is not None:
+            self.render_thread.check_superseded()
+
+    def quality_levels(self):
+        # Ступени качества от выбранной заливки вниз до монотонной, последняя — без сглаживания
+        modes = [ShadingMode.PHONG, ShadingMode.GOURAUD, ShadingMode.MONOTONE]
+        levels = [(mode, True) for mode in modes[modes.index(self.shading_mode):]]
+        return levels + [(ShadingMode.MONOTONE, False)]
+
+    def active_quality(self):
+        if self.interactive:
+            return ShadingMode.MONOTONE, False
+        levels = self.quality_levels()
+        return levels[min(self.quality_level, len(levels) - 1)]
+
+    def active_shading_mode(self):
+        return self.active_quality()[0]
+
+    def record_frame_time(self, seconds):
+        self.frame_time = seconds
+        if self.turntable:
+            self.adapt_quality(seconds)
+
+    def adapt_quality(self, seconds):
+        # Скользящее среднее времени кадра сравнивается с бюджетом: превышение — ступень вниз,
+        # запас больше половины бюджета — ступень вверх. После смены ступени среднее
+        # набирается заново; если повышение сразу пришлось откатить, следующее ждёт вдвое дольше
+        budget = 1.0 / TURNTABLE_FPS
+        if self.frame_time_average is None:
+            self.frame_time_average = seconds
+        else:
+            self.frame_time_average = 0.8 * self.frame_time_average + 0.2 * seconds
+        self.upgrade_wait -= 1
+        if self.quality_cooldown > 0:
+            self.quality_cooldown -= 1
+            return
+        lowest = len(self.quality_levels()) - 1
+        if self.frame_time_average > budget and self.quality_level < lowest:
+            if self.last_quality_step == 'up':
+                self.upgrade_backoff = min(self.upgrade_backoff * 2, 16)
+            self.quality_level += 1
+            self.last_quality_step = 'down'
+            self.upgrade_wait = QUALITY_COOLDOWN * self.upgrade_backoff
+        elif self.frame_time_average < budget * 0.5 and self.quality_level > 0 and self.upgrade_wait <= 0:
+            self.quality_level -= 1
+            self.last_quality_step = 'up'
+        else:
+            return
+        self.quality_cooldown = QUALITY_COOLDOWN
+        self.frame_time_average = None
+
+    def reset_quality(self):
+        self.quality_level = 0
+        self.quality_cooldown = 0
+        self.upgrade_wait = 0
+        self.upgrade_backoff = 1
+        self.last_quality_step = None
+        self.frame_time_average = None
+
+    def set_turntable(self, enabled):
+        # Режим и ступень качества читает поток отрисовки — они меняются через очередь,
+        # таймер вращения остаётся в потоке интерфейса
+        self.schedule_update(('turntable_mode',), enabled, self.apply_turntable_mode, (), interactive=False)
+        if enabled:
+            self.turntable_last = time.perf_counter()
+            self.turntable_timer.start()
+        else:
+            self.turntable_timer.stop()
+
+    def apply_turntable_mode(self, enabled):
+        self.turntable = enabled
+        self.reset_quality()
+
+    def turntable_tick(self):
+        # Угол по реальному времени: скорость вращения не зависит от потерянных кадров
+        now = time.perf_counter()
+        self.schedule_update(('turntable', None, 1), TURNTABLE_SPEED * (now - self.turntable_last),
+                             self.apply_turntable_rotation, ALL_STAGES, accumulate=True)
+        self.turntable_last = now
+
+    def apply_turntable_rotation(self, angle):
+        # Поворот сцены меняет положение камеры относительно букв: пересчитываются все этапы
+        self.turntable_angle = (self.turntable_angle + angle) % 360
+        self.turntable_node.transform = Matrix4x4.rotation_y(self.turntable_angle)
 
-    def invalidate_cache(self):
-        self.cache_valid = False
+    def scene_letters(self):
+        return self.letters
+
+    def set_text(self, text):
+        self.schedule_update(('text',), text, self.apply_text, ALL_STAGES, interactive=False)
+
+    def apply_text(self, text):
+        # Пустой текст возвращает исходную пару букв
+        self.text = text
+        self.letters = self.layout_text(text) if text.strip() else [self.d_letter, self.n_letter]
+        self.root.set_children(letter.node for letter in self.letters)
+
+    def set_letter_style(self, style):
+        self.schedule_update(('style',), style, self.apply_letter_style, ALL_STAGES, interactive=False)
+
+    def apply_letter_style(self, style):
+        # Форма граней меняет сетки всех букв; текст раскладывается заново, так как
+        # буквы с фаской берут ширину из шрифта
+        self.letter_style = style
+        for letter in (self.d_letter, self.n_letter):
+            letter.style = style
+            letter.update_geometry()
+        self.apply_text(self.text)
+
+    def layout_text(self, text):
+        # Строки текста по центру сцены; размер букв подбирается так, чтобы текст помещался в кадр.
+        # Буквы с одинаковыми параметрами получают одну общую сетку из шаблона
+        lines = text.upper().split('\n')
+        columns = max(len(line) for line in lines)
+        # Шаг по строке — по самой широкой букве (у «Д» перекладина шире стоек), чтобы
+        # буквы не пересекались и порядок давали их собственные BSP-деревья
+        chars = [char for char in set(text.upper()) if Letter3D.supports(char)]
+        unit_width = max((Letter3D.unit_width(char, self.letter_style) for char in chars), default=0.6)
+        advance_ratio = unit_width * 1.15
+        height = min(100.0, TEXT_WIDTH / (columns * advance_ratio), TEXT_HEIGHT / (len(lines) * 1.4))
+        width, depth = height * 0.6, height * 0.3
+        advance, line_height = height * advance_ratio, height * 1.4
+        letters = []
+        for row, line in enumerate(lines):
+            y = ((len(lines) - 1) / 2 - row) * line_height - height / 2
+            for column, char in enumerate(line):
+                if char not in chars:
+                    continue
+                letter = Letter3D(height, width, depth, letter_type=char, style=self.letter_style)
+                x = (column - (len(line) - 1) / 2) * advance
+                letter.transform = letter.transform * Matrix4x4.translation(x, y, 0)
+                letters.append(letter)
+        return letters
 
     def compute_phong_lighting(self, normal, position, inverse_transform):
+        normals = np.array([[normal.x, normal.y, normal.z]], dtype=float)
+        positions = np.array([[position.x, position.y, position.z]], dtype=float)
+        inverse_rotation = inverse_transform.to_array()[:3, :3]
+        return float(self.compute_phong_lighting_batch(normals, positions, inverse_rotation)[0])
+
+    def local_light_dir(self, inverse_rotation):
+        # Направление на свет в системе координат буквы, где заданы нормали граней
+        light = inverse_rotation @ [self.light_dir.x, self.light_dir.y, self.light_dir.z]
+        length = np.linalg.norm(light)
+        return light / length if length > 0 else light
+
+    def face_intensities(self, frame):
+        # Плоская заливка: одна интенсивность на грань сетки
+        light = self.local_light_dir(frame['inverse_rotation'])
+        return np.maximum(0.3, frame['mesh'].face_normals @ light)
+
+    def prepare_face_lighting(self):
+        # Интенсивности граней не зависят от камеры и считаются заново только при смене
+        # геометрии или света, вместе со ступенями таблицы оттенков
+        self.face_lighting = []
+        for frame in self.letter_frames:
+            intensities = self.face_intensities(frame)
+            self.face_lighting.append((intensities, self.shade_table.levels(intensities).tolist()))
+        self.lighting_version += 1
+
+    def local_light_dirs(self, inverse_rotations):
+        # Направления на свет в системах сразу многих букв (L×3)
+        light = inverse_rotations @ [self.light_dir.x, self.light_dir.y, self.light_dir.z]
+        lengths = np.linalg.norm(light, axis=1, keepdims=True)
+        return np.divide(light, lengths, out=light.copy(), where=lengths > 0)
+
+    def compute_phong_lighting_batch(self, normals, positions, inverse_rotation):
+        # Фоновая, диффузная и зеркальная составляющие для всех вершин (N×3) за один проход;
+        # направление на свет считается один раз на букву
+        return self.phong_intensity(normals, positions, self.local_light_dir(inverse_rotation))
+
+    def phong_intensity(self, normals, positions, light):
+        # light — направление на свет в системе буквы: одно (3) или своё у каждой точки (N×3)
         ambient_strength = 0.3
         diffuse_strength = 0.6
         specular_strength = 0.5
         shininess = 32
 
-        light_dir = inverse_transform * self.light_dir
-        light_dir = light_dir.normalized()
-
-        world_pos = self.object_transform * position
-        view_dir = (self.camera_pos - world_pos).normalized()
-
-        if normal.dot(light_dir) <= 0:
-            return ambient_strength
-
-        diffuse = diffuse_strength * max(0, normal.dot(light_dir))
-        reflect_dir = (light_dir - normal * (2 * normal.dot(light_dir))).normalized()
-        specular = specular_strength * max(0, reflect_dir.dot(view_dir)) ** shininess
-
-        intensity = ambient_strength + diffuse + specular
-        return min(1.0, max(0.3, intensity))
-
-    def clip_polygon_by_z0(self, vertices, normals, orig_vertices):
-        # Sutherland-Hodgman clipping по z=0
-        clipped_vertices = []
-        clipped_normals = []
-        clipped_orig = []
-        n = len(vertices)
-        for i in range(n):
-            curr_v, curr_n, curr_o = vertices[i], normals[i], orig_vertices[i]
-            prev_v, prev_n, prev_o = vertices[i - 1], normals[i - 1], orig_vertices[i - 1]
-            curr_in = curr_v.z > 0
-            prev_in = prev_v.z > 0
-            if curr_in:
-                if not prev_in:
-                    # Пересечение ребра с z=0
-                    t = (0 - prev_v.z) / (curr_v.z - prev_v.z)
-                    inter_v = Vector3D(
-                        prev_v.x + t * (curr_v.x - prev_v.x),
-                        prev_v.y + t * (curr_v.y - prev_v.y),
-                        0
-                    )
-                    inter_n = Vector3D(
-                        prev_n.x + t * (curr_n.x - prev_n.x),
-                        prev_n.y + t * (curr_n.y - prev_n.y),
-                        prev_n.z + t * (curr_n.z - prev_n.z)
-                    )
-                    inter_o = Vector3D(
-                        prev_o.x + t * (curr_o.x - prev_o.x),
-                        prev_o.y + t * (curr_o.y - prev_o.y),
-                        prev_o.z + t * (curr_o.z - prev_o.z)
-                    )
-                    clipped_vertices.append(inter_v)
-                    clipped_normals.append(inter_n)
-                    clipped_orig.append(inter_o)
-                clipped_vertices.append(curr_v)
-                clipped_normals.append(curr_n)
-                clipped_orig.append(curr_o)
-            elif prev_in:
-                # Пересечение ребра с z=0
-                t = (0 - prev_v.z) / (curr_v.z - prev_v.z)
-                inter_v = Vector3D(
-                    prev_v.x + t * (curr_v.x - prev_v.x),
-                    prev_v.y + t * (curr_v.y - prev_v.y),
-                    0
-                )
-                inter_n = Vector3D(
-                    prev_n.x + t * (curr_n.x - prev_n.x),
-                    prev_n.y + t * (curr_n.y - prev_n.y),
-                    prev_n.z + t * (curr_n.z - prev_n.z)
-                )
-                inter_o = Vector3D(
-                    prev_o.x + t * (curr_o.x - prev_o.x),
-                    prev_o.y + t * (curr_o.y - prev_o.y),
-                    prev_o.z + t * (curr_o.z - prev_o.z)
-                )
-                clipped_vertices.append(inter_v)
-                clipped_normals.append(inter_n)
-                clipped_orig.append(inter_o)
-        return clipped_vertices, clipped_normals, clipped_orig
+        object_matrix = self.object_transform.to_array()
+        camera = np.array([self.camera_pos.x, self.camera_pos.y, self.camera_pos.z])
+
+        world_pos = positions @ object_matrix[:3, :3].T + object_matrix[:3, 3]
+        view_dir = camera - world_pos
+        lengths = np.linalg.norm(view_dir, axis=1, keepdims=True)
+        view_dir = np.divide(view_dir, lengths, out=np.zeros_like(view_dir), where=lengths > 0)
+
+        n_dot_l = normals @ light if light.ndim == 1 else np.einsum('ij,ij->i', normals, light)
+        diffuse = diffuse_strength * np.maximum(0, n_dot_l)
+        reflect_dir = light - normals * (2 * n_dot_l)[:, None]
+        lengths = np.linalg.norm(reflect_dir, axis=1, keepdims=True)
+        reflect_dir = np.divide(reflect_dir, lengths, out=np.zeros_like(reflect_dir), where=lengths > 0)
+        r_dot_v = np.maximum(0, np.einsum('ij,ij->i', reflect_dir, view_dir))
+        specular = specular_strength * r_dot_v ** shininess
+
+        intensity = np.clip(ambient_strength + diffuse + specular, 0.3, 1.0)
+        return np.where(n_dot_l <= 0, ambient_strength, intensity)
 
     def compute_face_normal(self, vertices):
         # Пересчёт нормали для многоугольника (берём первые три точки)
@@ -126,115 +476,807 @@ class SceneWidget(QWidget):
         return normal.normalized()
 
     def prepare_faces_cache(self):
-        width, height = self.width(), self.height()
+        # Пересчитываются только сброшенные этапы, освещение — только если нужно режиму заливки
+        if self.dirty_stages & {STAGE_GEOMETRY, STAGE_TRANSFORM}:
+            self.run_stage('geometry', self.update_detail_levels)
+        if self.dirty_stages & {STAGE_GEOMETRY, STAGE_TRANSFORM, STAGE_ORDER}:
+            # Список граней сбрасывается сразу: брошенный между этапами кадр не оставит старый
+            self.cached_faces = None
+        if STAGE_GEOMETRY in self.dirty_stages:
+            self.run_stage('geometry', self.prepare_geometry)
+        if STAGE_TRANSFORM in self.dirty_stages:
+            self.run_stage('transform', self.prepare_transform)
+        if STAGE_ORDER in self.dirty_stages:
+            self.run_stage('order', self.prepare_order)
+        if STAGE_LIGHTING in self.dirty_stages and self.active_shading_mode() != ShadingMode.MONOTONE:
+            self.run_stage('lighting', self.prepare_lighting)
+        if self.cached_faces is None:
+            self.run_stage('order', self.prepare_draw_list)
+
+    def run_stage(self, name, prepare):
+        self.check_superseded()
+        started = time.perf_counter()
+        prepare()
+        self.stage_times[name] += time.perf_counter() - started
+
+    @property
+    def object_transform(self):
+        return self.root.transform
+
+    @object_transform.setter
+    def object_transform(self, matrix):
+        self.root.transform = matrix
+
+    def world_matrices(self, letters):
+        # Мировые матрицы берутся из узлов графа сцены, пересчитываются только изменённые
+        return np.array([letter.node.world for letter in letters], dtype=float).reshape(len(letters), 4, 4)
+
+    def update_detail_levels(self):
+        # Уровень детализации по размеру ограничивающей сферы буквы на экране.
+        # Смена уровня подменяет сетку, поэтому кэш пересобирается целиком
+        letters = self.scene_letters()
+        counts = np.array([letter.level_count() for letter in letters], dtype=int)
+        letters = [letter for letter, count in zip(letters, counts.tolist()) if count > 1]
+        if not letters:
+            return
+        counts = counts[counts > 1]
+        matrices = self.world_matrices(letters)
+        centers = np.hstack([[letter.mesh.center for letter in letters], np.ones((len(letters), 1))])
+        camera_centers = (matrices @ centers[..., None])[..., 0] @ self.camera_matrix().to_array().T
+        stretch = np.linalg.norm(matrices[:, :3, :3], axis=1).max(axis=1)
+        radii = np.array([letter.mesh.radius for letter in letters]) * stretch
+        depth = camera_centers[:, 2]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sizes = np.where(depth > self.near_plane, 2 * radii * max(self.projection_scale()) / depth, np.inf)
+        current = np.array([letter.level for letter in letters])
+        levels = self.detail_levels(current, sizes, counts)
+        changed = np.flatnonzero(levels != current)
+        for index in changed.tolist():
+            letters[index].set_level(int(levels[index]))
+        if len(changed):
+            self.invalidate_cache()
+
+    @staticmethod
+    def detail_levels(current, sizes, counts):
+        # Огрубление — только заметно ниже порога, уточнение — заметно выше; сразу для всех букв
+        thresholds = np.array(DETAIL_SIZES)
+        coarser = (sizes[:, None] < thresholds * (1 - DETAIL_HYSTERESIS)).sum(axis=1)
+        finer = (sizes[:, None] < thresholds * (1 + DETAIL_HYSTERESIS)).sum(axis=1)
+        levels = np.where(coarser > current, coarser, np.where(finer < current, finer, current))
+        return np.minimum(levels, counts - 1)
+
+    def prepare_geometry(self):
+        letters = self.scene_letters()
+        camera = np.array([self.camera_pos.x, self.camera_pos.y, self.camera_pos.z, 1.0])
+        matrices = self.world_matrices(letters)
+
+        # Отсечение нелицевых граней: камера переводится в систему каждой буквы,
+        # грань видна, если камера по ту сторону её плоскости, куда смотрит нормаль.
+        # Зависит только от положения камеры, поэтому не пересчитывается при её повороте
+        camera_key = tuple(camera.tolist())
+        cache = {letter: self.facing_cache[letter] for letter in letters if letter in self.facing_cache
+                 and self.facing_cache[letter][:3] == (letter.node.version, letter.mesh, camera_key)}
+        stale = [index for index, letter in enumerate(letters) if letter not in cache]
+        if stale:
+            eyes = np.linalg.solve(matrices[stale], np.broadcast_to(camera, (len(stale), 4))[..., None])[:, :3, 0]
+            for group in self.group_by([letters[index] for index in stale], lambda letter: id(letter.mesh)):
+                mesh = letters[stale[group[0]]].mesh
+                to_eye = eyes[group][:, None, :] - mesh.positions[mesh.face_indices[:, 0]]
+                for position, facing in zip(group, np.einsum('fk,ifk->if', mesh.face_normals, to_eye) > 0):
+                    letter = letters[stale[position]]
+                    cache[letter] = (letter.node.version, letter.mesh, camera_key, eyes[position], facing)
+        self.facing_cache = cache
+
+        self.letter_frames = []
+        for index, letter in enumerate(letters):
+            mesh = letter.mesh
+            frame = {
+                'letter': letter,
+                'mesh': mesh,
+                'matrix': matrices[index],
+                'inverse_rotation': letter.node.normal_matrix.T,
+                'eye': cache[letter][3],
+                'face_front_facing': cache[letter][4],
+                'positions': mesh.positions,
+                'normals': mesh.vertex_normals,
+                'vertex_array': mesh.vertex_array,
+                'bsp': mesh.bsp,
+            }
+            self.set_frame_fragments(frame, mesh.fragment_indices, mesh.fragment_lengths, mesh.fragment_faces,
+                                     (mesh.fragment_lists, mesh.triangles, mesh.triangle_fragments))
+            self.letter_frames.append(frame)
+        self.prepare_scene_tree()
+
+        # Экземпляры с общими массивами вершин и фрагментов преобразуются вместе
+        self.frame_groups = self.group_by(
+            self.letter_frames, lambda frame: (id(frame['vertex_array']), id(frame['fragments'])))
+        self.dirty_stages.discard(STAGE_GEOMETRY)
+
+    @staticmethod
+    def group_by(items, key):
+        groups = {}
+        for index, item in enumerate(items):
+            groups.setdefault(key(item), []).append(index)
+        return list(groups.values())
+
+    def set_frame_fragments(self, frame, fragments, lengths, fragment_faces, shared=None):
+        # shared — готовые списки фрагментов и треугольники общей сетки, иначе строятся заново
+        frame['fragments'] = fragments
+        frame['fragment_lengths'] = lengths
+        frame['fragment_faces'] = fragment_faces
+        frame['front_facing'] = frame['face_front_facing'][fragment_faces]
+        if shared is None:
+            shared = (Mesh.fragment_lists_of(fragments, lengths),) + fan_triangulate(fragments, lengths)
+        frame['fragment_lists'], frame['triangles'], frame['triangle_fragments'] = shared
+
+    def prepare_scene_tree(self):
+        # Буквы разделяются плоскостями по их ограничивающим параллелепипедам в мировых координатах.
+        # У отделимой буквы порядок даёт её собственное дерево, построенное вместе с геометрией;
+        # для пересекающихся букв строится общее дерево, только когда меняется их взаимное положение
+        boxes = []
+        for indices in self.group_by(self.letter_frames, lambda frame: id(frame['vertex_array'])):
+            vertex_array = self.letter_frames[indices[0]]['vertex_array']
+            matrices = np.array([self.letter_frames[index]['matrix'][:3] for index in indices])
+            world = np.einsum('ijk,vk->ivj', matrices, vertex_array)
+            boxes.extend(zip(indices, world.min(axis=1), world.max(axis=1)))
+        boxes.sort(key=lambda box: box[0])
+        self.scene_tree = self.build_scene_node(separate_boxes(boxes)) if boxes else None
+
+    def build_scene_node(self, node):
+        if node[0] == 'plane':
+            kind, axis, value, below, above = node
+            return (kind, axis, value, self.build_scene_node(below), self.build_scene_node(above))
+        letter_indices = node[1]
+        if len(letter_indices) == 1:
+            return ('letter', letter_indices[0])
+        return ('merged',) + self.build_merged_tree(letter_indices)
+
+    def build_merged_tree(self, letter_indices):
+        # Общее BSP-дерево в мировых координатах; вершины разрезов в системе своей буквы
+        # получаются той же интерполяцией, так как аффинное преобразование сохраняет долю t
+        offsets, positions, polygons, normals, tags = [], [], [], [], []
+        total = 0
+        for letter_index in letter_indices:
+            frame = self.letter_frames[letter_index]
+            matrix = frame['matrix']
+            normal_matrix = np.linalg.inv(matrix[:3, :3]).T
+            offsets.append(total)
+            positions.append(frame['vertex_array'] @ matrix[:3].T)
+            face_normals = frame['mesh'].face_normals @ normal_matrix.T
+            for fragment, (row, length) in enumerate(zip(frame['fragments'], frame['fragment_lengths'])):
+                polygons.append((row[:length] + total).tolist())
+                normals.append(face_normals[frame['fragment_faces'][fragment]])
+                tags.append((letter_index, int(frame['fragment_faces'][fragment])))
+            total += len(frame['vertex_array'])
+        tree = BSPTree(np.vstack(positions), polygons, normals, tags)
+
+        # Разрезы раскладываются по буквам: глобальный номер вершины -> (буква, локальный номер)
+        owners = {}
+        letter_splits = {letter_index: [] for letter_index in letter_indices}
+        vertex_counts = {letter_index: len(self.letter_frames[letter_index]['vertex_array'])
+                         for letter_index in letter_indices}
+
+        def locate(vertex):
+            if vertex < total:
+                slot = int(np.searchsorted(offsets, vertex, side='right')) - 1
+                return letter_indices[slot], vertex - offsets[slot]
+            return owners[vertex]
+
+        for split_index, (a, b, t) in enumerate(tree.splits):
+            letter_index, local_a = locate(a)
+            local_b = locate(b)[1]
+            letter_splits[letter_index].append((local_a, local_b, t))
+            owners[total + split_index] = (letter_index, vertex_counts[letter_index])
+            vertex_counts[letter_index] += 1
+
+        letter_polygons = {letter_index: [] for letter_index in letter_indices}
+        letter_faces = {letter_index: [] for letter_index in letter_indices}
+        mapping = []
+        for polygon, (letter_index, face_index) in zip(tree.polygons, tree.tags):
+            mapping.append((letter_index, len(letter_polygons[letter_index])))
+            letter_polygons[letter_index].append([locate(v)[1] for v in polygon])
+            letter_faces[letter_index].append(face_index)
+
+        for letter_index in letter_indices:
+            frame = self.letter_frames[letter_index]
+            splits = letter_splits[letter_index]
+            if splits:
+                frame['positions'] = apply_splits(frame['positions'], splits)
+                frame['normals'] = apply_splits(frame['normals'], splits, normalize=True)
+                frame['vertex_array'] = np.hstack([frame['positions'], np.ones((len(frame['positions']), 1))])
+            fragments, lengths = pad_polygons(letter_polygons[letter_index])
+            self.set_frame_fragments(frame, fragments, lengths, np.array(letter_faces[letter_index], dtype=np.intp))
+        return tree, mapping
+
+    def prepare_order(self):
+        # Обход от дальнего к ближнему зависит только от положения камеры, не от её поворота
+        self.draw_order = []
+        camera = (self.camera_pos.x, self.camera_pos.y, self.camera_pos.z)
+        stack = [self.scene_tree]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            if node[0] == 'plane':
+                kind, axis, value, below, above = node
+                near, far = (above, below) if camera[axis] >= value else (below, above)
+                stack.append(near)
+                stack.append(far)
+            elif node[0] == 'letter':
+                # Порядок хранится отрезками (буква, массив фрагментов)
+                frame = self.letter_frames[node[1]]
+                if frame['bsp'] is None:
+                    fragments = np.arange(len(frame['fragments']))
+                else:
+                    fragments = np.array(frame['bsp'].back_to_front(frame['eye']), dtype=np.intp)
+                self.draw_order.append((node[1], fragments))
+            else:
+                kind, tree, mapping = node
+                run_letter, run = None, []
+                for letter_index, fragment in (mapping[i] for i in tree.back_to_front(camera)):
+                    if letter_index != run_letter and run:
+                        self.draw_order.append((run_letter, np.array(run, dtype=np.intp)))
+                        run = []
+                    run_letter = letter_index
+                    run.append(fragment)
+                if run:
+                    self.draw_order.append((run_letter, np.array(run, dtype=np.intp)))
+        self.dirty_stages.discard(STAGE_ORDER)
+
+    def prepare_transform(self):
+        camera_matrix = self.camera_matrix().to_array()
+        stats = {'faces': 0, 'backface': 0, 'frustum': 0, 'visible': 0}
+        for group in self.frame_groups:
+            # Все экземпляры одной сетки за одно умножение: I матриц модель-вид на V вершин
+            frames = [self.letter_frames[index] for index in group]
+            fragments = frames[0]['fragments']
+            model_views = camera_matrix @ np.array([frame['matrix'] for frame in frames])
+            camera_points = frames[0]['vertex_array'] @ model_views.transpose(0, 2, 1)
+            count, vertices = camera_points.shape[:2]
+
+            # Отсечение по пирамиде видимости до проекции и освещения. Фрагменты проверяются
+            # только у экземпляров, у которых есть вершины вне пирамиды, остальные видны целиком
+            front_facing = np.array([frame['front_facing'] for frame in frames])
+            outside = self.outside_frustum(camera_points.reshape(-1, 4)).reshape(count, vertices, -1)
+            inside_frustum = np.ones(front_facing.shape, dtype=bool)
+            in_front = np.ones(front_facing.shape, dtype=bool)
+            partial = np.flatnonzero(outside.any(axis=(1, 2)))
+            if len(partial):
+                codes = outside[partial][:, fragments]
+                inside_frustum[partial] = ~codes.all(axis=2).any(axis=2)
+                in_front[partial] = ~codes[..., 0].any(axis=2)
+            visible = front_facing & inside_frustum
+            stats['faces'] += visible.size
+            stats['backface'] += int(np.count_nonzero(~front_facing))
+            stats['frustum'] += int(np.count_nonzero(front_facing & ~inside_frustum))
+            stats['visible'] += int(np.count_nonzero(visible))
+
+            screen = self.project_to_screen(camera_points.reshape(-1, 4)).reshape(count, vertices, 2)
+            self.finish_transform(frames, camera_points, screen, visible, in_front)
+        self.cull_stats = stats
+        self.dirty_stages.discard(STAGE_TRANSFORM)
+
+    def finish_transform(self, frames, camera_points, screen, visible, in_front):
+        # Итоги преобразования раскладываются по экземплярам группы без циклов по вершинам.
+        # Многоугольники — списки индексов: у целых фрагментов общие из сетки, обрезанные
+        # лежат в clipped и ссылаются на вершины отсечения, дописанные в конец
+        unclipped = visible & in_front
+        crossing = visible & ~in_front
+        # Экранные рамки букв по вершинам перед ближней плоскостью — для перерисовки по областям
+        # (координаты — строками I×2×V: свёртка по непрерывной оси заметно быстрее)
+        columns = np.ascontiguousarray(screen.transpose(0, 2, 1))
+        front = (camera_points[..., 2] >= self.near_plane)[:, None, :]
+        if front.all():
+            boxes = self.screen_boxes(columns.min(axis=2), columns.max(axis=2))
+        else:
+            boxes = self.screen_boxes(np.where(front, columns, np.inf).min(axis=2),
+                                      np.where(front, columns, -np.inf).max(axis=2))
+        for i, frame in enumerate(frames):
+            frame['screen'] = screen[i]
+            frame['depths'] = camera_points[i, :, 2]
+            frame['points'] = None
+            frame['clip_edges'] = NO_CLIP_EDGES
+            frame['visible'] = visible[i]
+            frame['unclipped'] = unclipped[i]
+            frame['clipped'] = {}
+            frame['screen_box'] = boxes[i]
+        # Фрагменты, пересекающие ближнюю плоскость, обрезаются только у тех букв, где они есть
+        for i in np.flatnonzero(crossing.any(axis=1)).tolist():
+            self.clip_frame(frames[i], camera_points[i], np.flatnonzero(crossing[i]))
+
+    def clip_frame(self, frame, camera_points, crossing):
+        polygons, clip_edges = self.clip_near_plane(frame['fragments'][crossing], camera_points[:, 2],
+                                                    len(camera_points))
+        clip_points = self.lerp(camera_points, clip_edges)
+        clip_screen = self.project_to_screen(clip_points)
+        frame['screen'] = np.vstack([frame['screen'], clip_screen])
+        frame['depths'] = np.concatenate([frame['depths'], clip_points[:, 2]])
+        frame['clip_edges'] = clip_edges
+        frame['clipped'] = dict(zip(crossing.tolist(), (polygon.tolist() for polygon in polygons)))
+        if len(clip_screen):
+            box = self.screen_boxes(clip_screen.min(axis=0)[None], clip_screen.max(axis=0)[None])[0]
+            if frame['screen_box'] is not None:
+                box = tuple(map(min, box[:2], frame['screen_box'][:2])) + \
+                    tuple(map(max, box[2:], frame['screen_box'][2:]))
+            frame['screen_box'] = box
+
+    @staticmethod
+    def screen_points(frame):
+        # Точки QPointF вершин буквы создаются при первом обращении: растровому выводу они не нужны
+        if frame['points'] is None:
+            frame['points'] = [QPointF(px, py) for px, py in frame['screen'].tolist()]
+        return frame['points']
+
+    @staticmethod
+    def screen_boxes(lows, highs):
+        # Целочисленные рамки (x0, y0, x1, y1) по углам N×2; None — у буквы нет точек перед камерой
+        bounds = np.hstack([lows, highs])
+        valid = np.isfinite(bounds).all(axis=1).tolist()
+        bounds = np.clip(np.nan_to_num(bounds), -1e6, 1e6)
+        bounds = np.hstack([np.floor(bounds[:, :2]), np.ceil(bounds[:, 2:])]).astype(int).tolist()
+        return [tuple(box) if ok else None for box, ok in zip(bounds, valid)]
+
+    def clip_near_plane(self, face_indices, depths, first_new_index):
+        # Пакетный Сазерленд-Ходжман по плоскости z = near_plane для многоугольников C×K.
+        # Возвращает многоугольники (индексы вершин) и рёбра новых вершин (a, b, t):
+        # новая вершина i лежит на отрезке a[i] -> b[i] в доле t[i]
+        near = self.near_plane
+        current = face_indices
+        following = np.roll(face_indices, -1, axis=1)
+        z_current, z_following = depths[current], depths[following]
+        current_in = z_current >= near
+        crossing = current_in != (z_following >= near)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (near - z_current) / (z_following - z_current)
+        new_ids = np.full(current.shape, -1, dtype=np.intp)
+        new_ids[crossing] = first_new_index + np.arange(np.count_nonzero(crossing))
+        clip_edges = (current[crossing], following[crossing], t[crossing])
+
+        # Для каждого ребра: сама вершина, если она перед плоскостью, затем точка пересечения
+        count, corners = current.shape
+        slots = np.stack([current, new_ids], axis=2).reshape(count, 2 * corners)
+        keep = np.stack([current_in, crossing], axis=2).reshape(count, 2 * corners)
+        return [row[mask] for row, mask in zip(slots, keep)], clip_edges
+
+    @staticmethod
+    def lerp(values, clip_edges):
+        # Значения в новых вершинах отсечения по рёбрам (a, b, t)
+        edge_a, edge_b, edge_t = clip_edges
+        t = edge_t.reshape((-1,) + (1,) * (values.ndim - 1))
+        return values[edge_a] + t * (values[edge_b] - values[edge_a])
+
+    def prepare_draw_list(self):
+        # Видимые фрагменты в порядке обхода BSP: обрезанные ближней плоскостью берут свой многоугольник
         self.cached_faces = []
+        self.draw_list_version += 1
+        for letter_index, fragments in self.draw_order:
+            frame = self.letter_frames[letter_index]
+            fragment_lists, clipped = frame['fragment_lists'], frame['clipped']
+            shown = fragments[frame['visible'][fragments]]
+            for fragment, face_index in zip(shown.tolist(), frame['fragment_faces'][shown].tolist()):
+                polygon = clipped[fragment] if fragment in clipped else fragment_lists[fragment]
+                self.cached_faces.append((letter_index, face_index, polygon, fragment))
+
+    def clipped_attributes(self, frame, values):
+        # Атрибуты вершин сетки, дополненные значениями в вершинах отсечения
+        return np.concatenate([values, self.lerp(values, frame['clip_edges'])])
+
+    def prepare_lighting(self):
+        # Освещение считается одним проходом по уникальным вершинам буквы
+        self.vertex_intensities = []
+        for frame in self.letter_frames:
+            # Считаются только вершины лицевых фрагментов, остальные получают фоновую составляющую
+            used = np.unique(frame['fragments'][frame['front_facing']])
+            intensities = np.full(len(frame['positions']), 0.3)
+            intensities[used] = self.compute_phong_lighting_batch(
+                frame['normals'][used], frame['positions'][used], frame['inverse_rotation'])
+            self.vertex_intensities.append(intensities)
+        self.lighting_version += 1
+        self.dirty_stages.discard(STAGE_LIGHTING)
+
+    def projection_scale(self):
+        # Множители перспективы по осям экрана: x_экр = x * k / z + ширина / 2
+        aspect = self.width() / self.height()
+        scale_x = self.base_scale * (1 / aspect if aspect > 1 else 1)
+        scale_y = self.base_scale * (1 if aspect > 1 else aspect)
+        return 300 * scale_x, 300 * scale_y
 
-        for letter in [self.d_letter, self.n_letter]:
-            scale_matrix = Matrix4x4.scaling(letter.scale, letter.scale, letter.scale)
-            letter_transform = self.object_transform * letter.transform * scale_matrix
-            inverse_transform = letter_transform.inverse_rotation()
-
-            transformed_vertices = []
-            vertex_normals = []
-            for v in letter.vertices:
-                normal_sum = Vector3D(0, 0, 0)
-                count = 0
-                for face in letter.faces:
-                    if v in face.vertices:
-                        normal_sum += face.normal
-                        count += 1
-                vertex_normal = normal_sum.normalized() if count > 0 else Vector3D(0, 0, 1)
-
-                v_transformed = letter_transform * v
-                v_camera = self.apply_camera_transform(v_transformed)
-                transformed_vertices.append(v_camera)
-                vertex_normals.append(vertex_normal)
-
-            for face in letter.faces:
-                face_vertices = [transformed_vertices[letter.vertices.index(v)] for v in face.vertices]
-                face_normals = [vertex_normals[letter.vertices.index(v)] for v in face.vertices]
-                original_vertices = face.vertices
-
-                # Грань отображается, если все вершины видимы
-                if all(v.z > 0 for v in face_vertices) and len(face_vertices) >= 3:
-                    screen_points = []
-                    intensities = []
-                    for i, v in enumerate(face_vertices):
-                        factor = 300 / v.z
-                        aspect = width / height
-                        px = v.x * factor * self.base_scale * (1 / aspect if aspect > 1 else 1) + width / 2
-                        py = v.y * factor * self.base_scale * (1 if aspect > 1 else aspect) + height / 2
-                        screen_points.append(QPointF(px, py))
-                        intensity = self.compute_phong_lighting(face_normals[i], original_vertices[i],
-                                                                inverse_transform)
-                        intensities.append(intensity)
-                    avg_depth = sum(v.z for v in face_vertices) / len(face_vertices)
-                    self.cached_faces.append((avg_depth, face, screen_points, intensities))
-        self.cached_faces.sort(reverse=True, key=lambda x: x[0])
+    def project_to_screen(self, camera_points):
+        # Перспективная проекция массива точек в системе камеры (N×3 или N×4) в экран (N×2)
+        width, height = self.width(), self.height()
+        k_x, k_y = self.projection_scale()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inv_z = 1 / camera_points[:, 2]
+        screen = np.empty((len(camera_points), 2))
+        screen[:, 0] = camera_points[:, 0] * k_x * inv_z + width / 2
+        screen[:, 1] = camera_points[:, 1] * k_y * inv_z + height / 2
+        return screen
+
+    def outside_frustum(self, camera_points):
+        # Коды отсечения (N×5): вершина за ближней, левой, правой, верхней, нижней плоскостью.
+        # Боковые плоскости проходят через камеру, поэтому проверка обходится без деления на z
+        half_w, half_h = self.width() / 2, self.height() / 2
+        k_x, k_y = self.projection_scale()
+        x, y, z = camera_points[:, 0] * k_x, camera_points[:, 1] * k_y, camera_points[:, 2]
+        return np.column_stack([z < self.near_plane, x < -half_w * z, x > half_w * z, y < -half_h * z, y > half_h * z])
 
     def paintEvent(self, event):
+        if self.render_thread is None:
+            painter = QPainter(self)
+            self.paint_frame(painter)
+            painter.end()
+            return
+        # С фоновым потоком на экран только копируется готовый кадр; если его размер
+        # не совпадает с виджетом (показ окна, изменение размера), заказывается новый
         painter = QPainter(self)
-        painter.setRenderHint(QPainter.Antialiasing, True)
-        painter.fillRect(self.rect(), QColor(35, 35, 35))
-
-        if not self.cache_valid or self.cached_faces is None:
-            self.prepare_faces_cache()
-            self.cache_valid = True
-
-        for depth, face, screen_points, intensities in self.cached_faces:
-            polygon = QPolygonF(screen_points)
-
-            # Выбор метода заливки
-            if self.shading_mode == ShadingMode.MONOTONE:
-                intensity = max(0.3, face.normal.dot(self.light_dir))
-                color = QColor(
-                    min(255, int(255 * intensity)),
-                    min(255, int(105 * intensity)),
-                    min(255, int(180 * intensity))
-                )
-                painter.setPen(QPen(color, 1))
-                painter.setBrush(QBrush(color))
-                painter.drawPolygon(polygon)
-            elif self.shading_mode == ShadingMode.GOURAUD:
-                gradient = QLinearGradient(screen_points[0], screen_points[2])
-                base_color = QColor(255, 105, 180)  # Один базовый цвет
-                for i, point in enumerate(screen_points):
-                    intensity = intensities[i]
-                    color = QColor(
-                        min(255, int(base_color.red() * intensity)),
-                        min(255, int(base_color.green() * intensity)),
-                        min(255, int(base_color.blue() * intensity))
-                    )
-                    gradient.setColorAt(i / (len(screen_points) - 1), color)
-                painter.setPen(Qt.NoPen)
-                painter.setBrush(QBrush(gradient))
+        size = self.render_thread.blit(painter, self.rect())
+        if size is None:
+            painter.fillRect(self.rect(), self.background_color)
+        painter.end()
+        if size != self.size():
+            self.request_frame()
+
+    def render_frame(self, image, previous=None):
+        # Кадр фонового потока: всё состояние сцены читается и меняется под state_lock.
+        # previous — последний готовый кадр; возвращается перерисованный прямоугольник или None
+        with self.state_lock:
+            painter = QPainter(image)
+            try:
+                return self.paint_frame(painter, previous)
+            finally:
+                painter.end()
+
+    def show_frame(self, dirty):
+        if dirty is None:
+            self.update()
+        elif not dirty.isEmpty():
+            self.update(dirty)
+
+    def paint_frame(self, painter, previous=None):
+        # Перерисовка раньше такта (показ окна, grab) тоже видит все накопленные изменения
+        self.apply_pending_updates()
+        if self.profiler is not None:
+            self.profiler.enable()
+        started = time.perf_counter()
+        self.stage_times = dict.fromkeys(PROFILE_STAGES, 0.0)
+        shading_mode, antialiasing = self.active_quality()
+        resolution = self.interactive_resolution if self.interactive else 1.0
+        painter.setRenderHint(QPainter.Antialiasing, antialiasing)
+
+        dirty = None
+        if self.active_backend() == RenderBackend.RASTER:
+            self.letter_boxes = None
+            self.render_raster(painter, shading_mode, resolution)
+        else:
+            dirty = self.begin_partial_frame(painter, shading_mode, resolution, previous)
+            if resolution < 1.0:
+                # Сцена рисуется в уменьшенное изображение и растягивается на виджет. Изображение
+                # хранит прошлый кадр, пока его не испортил брошенный на середине кадр
+                width = max(1, int(self.width() * resolution))
+                height = max(1, int(self.height() * resolution))
+                if self.low_res_image is None or self.low_res_image.size() != QSize(width, height):
+                    self.low_res_image = QImage(width, height, QImage.Format_RGB32)
+                self.low_res_valid = False
+                image_painter = QPainter(self.low_res_image)
+                image_painter.scale(width / self.width(), height / self.height())
+                try:
+                    self.render_painter(image_painter, shading_mode, dirty)
+                finally:
+                    image_painter.end()
+                self.low_res_valid = True
+                painter.drawImage(QRectF(self.rect()), self.low_res_image)
+            else:
+                self.render_painter(painter, shading_mode, dirty)
+            self.letter_boxes = self.pending_boxes
+        self.draw_light_source(painter)
+        painter.setClipping(False)
+
+        # Рисование — всё, что не попало в этапы подготовки кэша
+        elapsed = time.perf_counter() - started
+        self.stage_times['draw'] = max(0.0, elapsed - sum(self.stage_times.values()))
+        self.frame_history.append((started, elapsed))
+        if self.show_profiler:
+            self.draw_profiler_overlay(painter, shading_mode, antialiasing)
+        self.record_frame_time(elapsed)
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiled_frames += 1
+            if self.profiled_frames >= PROFILE_FRAMES:
+                self.finish_profile()
+        return dirty
+
+    def toggle_profiler(self):
+        # Панель и профилировщик читает поток отрисовки, поэтому они включаются через очередь.
+        # Нажатия складываются: за кадр панель переключается, только если их было нечётное число
+        self.schedule_update(('profiler', None, 0), 1, self.apply_toggle_profiler, (), accumulate=True,
+                             interactive=False)
+
+    def apply_toggle_profiler(self, presses):
+        if presses % 2:
+            self.show_profiler = not self.show_profiler
+
+    def capture_profile(self):
+        # Снимок cProfile следующих PROFILE_FRAMES кадров в файл текущего каталога
+        self.schedule_update(('capture',), None, lambda _: self.apply_capture_profile(), (), interactive=False)
+
+    def apply_capture_profile(self):
+        if self.profiler is not None:
+            return
+        self.profiler = cProfile.Profile()
+        self.profiled_frames = 0
+
+    def finish_profile(self):
+        self.profile_path = time.strftime('lab2_profile_%Y%m%d_%H%M%S.prof')
+        self.profiler.dump_stats(self.profile_path)
+        self.profiler = None
+
+    def profiler_lines(self, shading_mode, antialiasing):
+        now = time.perf_counter()
+        fps = sum(1 for started, _ in self.frame_history if now - started <= 1.0)
+        times = np.array([elapsed for _, elapsed in self.frame_history]) * 1000
+        p50, p95, p99 = np.percentile(times, [50, 95, 99]) if len(times) else (0, 0, 0)
+        vertices = sum(len(frame['positions']) for frame in self.letter_frames)
+        stats = self.cull_stats
+        lines = [
+            f"FPS: {fps}",
+            f"кадр, мс: p50 {p50:.1f}  p95 {p95:.1f}  p99 {p99:.1f}",
+            f"фрагментов: {stats['faces']}  вершин: {vertices}",
+            f"отсечено: нелицевых {stats['backface']}  вне обзора {stats['frustum']}",
+            f"видимых: {stats['visible']}",
+            f"заливка: {shading_mode.value}{'' if antialiasing else ', без сглаживания'}",
+        ]
+        names = {'geometry': 'геометрия', 'transform': 'преобразование', 'lighting': 'освещение',
+                 'order': 'порядок', 'draw': 'рисование'}
+        lines += [f"{names[stage]}: {self.stage_times[stage] * 1000:.2f} мс" for stage in PROFILE_STAGES]
+        if self.profiler is not None:
+            lines.append(f"cProfile: кадр {self.profiled_frames + 1} из {PROFILE_FRAMES}")
+        elif self.profile_path:
+            lines.append(f"профиль: {self.profile_path}")
+        return lines
+
+    def draw_profiler_overlay(self, painter, shading_mode, antialiasing):
+        lines = self.profiler_lines(shading_mode, antialiasing)
+        painter.setFont(QFont('Monospace', 9))
+        line_height = painter.fontMetrics().height()
+        width = max(painter.fontMetrics().horizontalAdvance(line) for line in lines) + 16
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor(0, 0, 0, 160))
+        painter.drawRect(8, 8, width, line_height * len(lines) + 12)
+        painter.setPen(QColor(200, 255, 200))
+        for i, line in enumerate(lines):
+            painter.drawText(16, 14 + line_height * (i + 1) - painter.fontMetrics().descent(), line)
+
+    def render_painter(self, painter, shading_mode, dirty=None):
+        # dirty — прямоугольник частичной перерисовки: заливается только он и рисуются
+        # только задевающие его грани, в общем порядке кадра
+        self.prepare_painter_frame(shading_mode)
+        commands = self.paint_commands
+        if dirty is None:
+            painter.fillRect(self.rect(), self.background_color)
+        else:
+            painter.setClipRect(dirty)
+            painter.fillRect(dirty, self.background_color)
+            commands = [commands[index] for index in self.overlapping_commands(dirty).tolist()]
+        for start in range(0, len(commands), PAINT_CHUNK):
+            self.check_superseded()
+            for polygon, pen, brush in commands[start:start + PAINT_CHUNK]:
+                painter.setPen(pen)
+                painter.setBrush(brush)
                 painter.drawPolygon(polygon)
-            elif self.shading_mode == ShadingMode.PHONG:
-                if screen_points:
-                    x_sum = sum(p.x() for p in screen_points)
-                    y_sum = sum(p.y() for p in screen_points)
-                    count = len(screen_points)
-                    center = QPointF(x_sum / count, y_sum / count)
-                else:
-                    center = QPointF(0, 0)
 
+    def prepare_painter_frame(self, shading_mode):
+        self.prepare_faces_cache()
+        if shading_mode == ShadingMode.MONOTONE and self.face_lighting is None:
+            self.run_stage('lighting', self.prepare_face_lighting)
+        key = (self.draw_list_version, self.lighting_version, shading_mode)
+        if key != self.paint_key:
+            self.prepare_paint_commands(shading_mode)
+            self.paint_key = key
+
+    def begin_partial_frame(self, painter, shading_mode, resolution, previous):
+        # Если кадр можно дорисовать поверх прошлого, тот копируется целиком, а рисование
+        # ограничивается прямоугольником перерисовки. None — кадр рисуется полностью
+        self.prepare_painter_frame(shading_mode)
+        dirty = self.repaint_region(previous, resolution)
+        if dirty is not None:
+            painter.setCompositionMode(QPainter.CompositionMode_Source)
+            painter.drawImage(0, 0, previous)
+            painter.setCompositionMode(QPainter.CompositionMode_SourceOver)
+            painter.setClipRect(dirty)
+        return dirty
+
+    def repaint_region(self, previous, resolution):
+        # Всё, кроме самих букв (камера, свет, размер, качество, набор букв), входит в ключ кадра;
+        # буква сменилась, если у неё новая версия узла, другая сетка или другие фрагменты (буквы
+        # с пересекающимися рамками режут друг друга в общем BSP-дереве). Перерисовывается
+        # объединение старых и новых рамок сменившихся букв
+        position, light = self.camera_pos, self.light_dir
+        key = (self.width(), self.height(), resolution, self.active_quality(), tuple(self.camera_rot),
+               (position.x, position.y, position.z), (light.x, light.y, light.z), self.near_plane,
+               self.base_scale, self.show_profiler, tuple(self.letters))
+        boxes = {frame['letter']: ((frame['letter'].node.version, frame['mesh'], frame['fragments']),
+                                   self.letter_box(frame))
+                 for frame in self.letter_frames}
+        committed, self.pending_boxes = self.letter_boxes, (key, boxes)
+        if previous is None or previous.size() != self.size() or committed is None or committed[0] != key \
+                or self.show_profiler or (resolution < 1.0 and not self.low_res_valid):
+            return None
+        dirty = QRect()
+        for letter, (version, box) in boxes.items():
+            old_version, old_box = committed[1].get(letter, ((None, None, None), QRect()))
+            if version[0] != old_version[0] or version[1] is not old_version[1] or version[2] is not old_version[2]:
+                dirty |= box | old_box
+        return dirty
+
+    def letter_box(self, frame):
+        # Экранная рамка вершин буквы перед ближней плоскостью и точек отсечения, с запасом
+        # на сглаживание, в пределах виджета
+        if frame['screen_box'] is None:
+            return QRect()
+        x0, y0, x1, y1 = frame['screen_box']
+        box = QRect(QPoint(x0 - DIRTY_MARGIN, y0 - DIRTY_MARGIN), QPoint(x1 + DIRTY_MARGIN, y1 + DIRTY_MARGIN))
+        return box.intersected(self.rect())
+
+    def overlapping_commands(self, dirty):
+        # Номера команд рисования, рамки которых задевают прямоугольник (с запасом на сглаживание)
+        if self.paint_boxes_key != self.paint_key:
+            self.paint_boxes = self.paint_command_boxes()
+            self.paint_boxes_key = self.paint_key
+        boxes = self.paint_boxes
+        left, top = dirty.left() - DIRTY_MARGIN, dirty.top() - DIRTY_MARGIN
+        right, bottom = dirty.right() + 1 + DIRTY_MARGIN, dirty.bottom() + 1 + DIRTY_MARGIN
+        return np.flatnonzero((boxes[:, 0] <= right) & (boxes[:, 2] >= left) &
+                              (boxes[:, 1] <= bottom) & (boxes[:, 3] >= top))
+
+    def paint_command_boxes(self):
+        # Рамки целых фрагментов считаются по дополненным многоугольникам сразу для всей буквы,
+        # обрезанных ближней плоскостью — по их собственным вершинам
+        fragment_boxes = []
+        for frame in self.letter_frames:
+            points = frame['screen'][frame['fragments']]
+            letter_boxes = np.hstack([points.min(axis=1), points.max(axis=1)])
+            for fragment, indices in frame['clipped'].items():
+                clipped = frame['screen'][indices]
+                letter_boxes[fragment] = np.concatenate([clipped.min(axis=0), clipped.max(axis=0)])
+            fragment_boxes.append(letter_boxes)
+        if not self.cached_faces:
+            return np.zeros((0, 4))
+        letter_indices, fragments = np.array([(face[0], face[3]) for face in self.cached_faces]).T
+        offsets = np.cumsum([0] + [len(boxes) for boxes in fragment_boxes])
+        return np.vstack(fragment_boxes)[offsets[letter_indices] + fragments]
+
+    def prepare_paint_commands(self, shading_mode):
+        # Цвета берутся из таблицы оттенков: однотонные перья и кисти общие для всех кадров,
+        # градиенты создаются только при смене списка граней или освещения
+        table = self.shade_table
+        self.paint_commands = []
+        if shading_mode == ShadingMode.MONOTONE:
+            for letter_index, face_index, indices, fragment in self.cached_faces:
+                level = self.face_lighting[letter_index][1][face_index]
+                points = self.screen_points(self.letter_frames[letter_index])
+                polygon = QPolygonF([points[i] for i in indices])
+                self.paint_commands.append((polygon, table.pens[level], table.brushes[level]))
+            return
+
+        letter_intensities = [self.clipped_attributes(frame, intensities)
+                              for frame, intensities in zip(self.letter_frames, self.vertex_intensities)]
+        letter_levels = [table.levels(intensities) for intensities in letter_intensities]
+        for letter_index, face_index, indices, fragment in self.cached_faces:
+            points = self.screen_points(self.letter_frames[letter_index])
+            screen_points = [points[i] for i in indices]
+            if shading_mode == ShadingMode.GOURAUD:
+                # Цвета вершин — остановки градиента вдоль многоугольника
+                levels = letter_levels[letter_index][indices].tolist()
+                gradient = QLinearGradient(screen_points[0], screen_points[2])
+                last = len(screen_points) - 1
+                gradient.setStops([(i / last, table.colors[level]) for i, level in enumerate(levels)])
+            else:
+                # Фонг: от цвета средней интенсивности в центре к затемнённому краю
+                intensities = letter_intensities[letter_index][indices]
+                count = len(screen_points)
+                center = QPointF(sum(p.x() for p in screen_points) / count, sum(p.y() for p in screen_points) / count)
+                level = table.level(float(intensities.mean()))
                 gradient = QLinearGradient(center, screen_points[0])
-                center_intensity = sum(intensities) / len(intensities)
-                base_color = QColor(255, 105, 180)  # Один базовый цвет
-                r = min(255, int(base_color.red() * center_intensity))
-                g = min(255, int(base_color.green() * center_intensity))
-                b = min(255, int(base_color.blue() * center_intensity))
-                gradient.setColorAt(0, QColor(r, g, b))
-                # Edge color (темнее)
-                edge_r = int(r * 0.7)
-                edge_g = int(g * 0.7)
-                edge_b = int(b * 0.7)
-                gradient.setColorAt(1, QColor(edge_r, edge_g, edge_b))
-                painter.setPen(Qt.NoPen)
-                painter.setBrush(QBrush(gradient))
-                painter.drawPolygon(polygon)
+                gradient.setStops([(0, table.colors[level]), (1, table.edge_colors[level])])
+            self.paint_commands.append((QPolygonF(screen_points), self.no_pen, QBrush(gradient)))
 
-        self.draw_light_source(painter)
+    def render_raster(self, painter, shading_mode, resolution=1.0):
+        # Порядок фрагментов не нужен: видимость решает буфер глубины
+        if self.dirty_stages & {STAGE_GEOMETRY, STAGE_TRANSFORM}:
+            self.run_stage('geometry', self.update_detail_levels)
+        if STAGE_GEOMETRY in self.dirty_stages:
+            self.run_stage('geometry', self.prepare_geometry)
+        if STAGE_TRANSFORM in self.dirty_stages:
+            self.run_stage('transform', self.prepare_transform)
+        if STAGE_LIGHTING in self.dirty_stages and shading_mode == ShadingMode.GOURAUD:
+            self.run_stage('lighting', self.prepare_lighting)
+        if shading_mode == ShadingMode.MONOTONE and self.face_lighting is None:
+            self.run_stage('lighting', self.prepare_face_lighting)
+
+        self.rasterizer.resize(max(1, int(self.width() * resolution)), max(1, int(self.height() * resolution)))
+        self.rasterizer.clear(BACKGROUND_COLOR)
+        base_color = np.array(BASE_COLOR, dtype=float)
+
+        # Все буквы кадра — один пакет растеризатора: накладные расходы на пакет не растут с числом букв
+        frames = self.letter_frames
+        if frames:
+            triangles, letters, faces, offsets = self.raster_triangles()
+            if shading_mode == ShadingMode.MONOTONE:
+                # Плоская заливка: одна интенсивность на грань
+                face_intensity = np.concatenate([lighting[0] for lighting in self.face_lighting])
+                face_offsets = np.cumsum([0] + [len(lighting[0]) for lighting in self.face_lighting[:-1]])
+                triangle_intensity = face_intensity[face_offsets[letters] + faces]
+                attributes = np.zeros((offsets[-1], 1))
+                shade = lambda attrs, t: base_color * triangle_intensity[t][:, None]
+            elif shading_mode == ShadingMode.GOURAUD:
+                # Гуро: интенсивности вершин интерполируются по барицентрическим координатам
+                attributes = self.letter_attributes(self.vertex_intensities)[:, None]
+                shade = lambda attrs, t: attrs * base_color
+            else:
+                # Фонг: интерполируются нормаль и положение, освещение считается в каждом пикселе
+                attributes = self.letter_attributes(
+                    [np.hstack([frame['normals'], frame['positions']]) for frame in frames])
+                lights = self.local_light_dirs(np.array([frame['inverse_rotation'] for frame in frames]))
+
+                def shade(attrs, t):
+                    normals = attrs[:, :3]
+                    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+                    normals = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+                    intensity = self.phong_intensity(normals, attrs[:, 3:], lights[letters[t]])
+                    return intensity[:, None] * base_color
+
+            screen = np.concatenate([frame['screen'] for frame in frames]) * resolution
+            depths = np.concatenate([frame['depths'] for frame in frames])
+            self.rasterizer.draw_triangles(screen, depths, triangles, attributes, shade)
+
+        self.rasterizer.flush()
+        if resolution < 1.0:
+            painter.drawImage(QRectF(self.rect()), self.rasterizer.image)
+        else:
+            painter.drawImage(0, 0, self.rasterizer.image)
+
+    def raster_triangles(self):
+        # Треугольники всех букв в общей нумерации вершин: номера вершин, буква и грань каждого
+        # треугольника, смещения вершин букв (последнее — их общее число). Целые экземпляры одной
+        # сетки разбираются разом по группе; порядок — по буквам, как при отдельных пакетах
+        frames = self.letter_frames
+        offsets = np.cumsum([0] + [len(frame['depths']) for frame in frames])
+        triangles, letters, faces = [], [], []
+        for group in self.frame_groups:
+            whole = np.array([index for index in group if not frames[index]['clipped']], dtype=np.intp)
+            if len(whole):
+                first = frames[whole[0]]
+                keep = np.array([frames[index]['unclipped'] for index in whole.tolist()])[
+                    :, first['triangle_fragments']]
+                instance, triangle = np.nonzero(keep)
+                triangles.append(first['triangles'][triangle] + offsets[whole][instance, None])
+                letters.append(whole[instance])
+                faces.append(first['fragment_faces'][first['triangle_fragments'][triangle]])
+            for index in group:
+                if frames[index]['clipped']:
+                    letter_triangles, triangle_fragments = self.polygon_triangles(frames[index])
+                    triangles.append(letter_triangles + offsets[index])
+                    letters.append(np.full(len(letter_triangles), index))
+                    faces.append(frames[index]['fragment_faces'][triangle_fragments])
+        letters = np.concatenate(letters)
+        order = np.argsort(letters, kind='stable')
+        return np.concatenate(triangles)[order], letters[order], np.concatenate(faces)[order], offsets
+
+    def letter_attributes(self, values):
+        # Атрибуты вершин всех букв подряд, у обрезанных — с вершинами отсечения
+        return np.concatenate([self.clipped_attributes(frame, letter_values) if frame['clipped'] else letter_values
+                               for frame, letter_values in zip(self.letter_frames, values)])
+
+    def polygon_triangles(self, frame):
+        # Треугольники целых видимых фрагментов готовы заранее, обрезанные многоугольники — веером
+        keep = frame['unclipped'][frame['triangle_fragments']]
+        triangles, triangle_fragments = [frame['triangles'][keep]], [frame['triangle_fragments'][keep]]
+        for fragment, indices in frame['clipped'].items():
+            fan = np.column_stack([np.full(len(indices) - 2, indices[0]), indices[1:-1], indices[2:]])
+            triangles.append(fan)
+            triangle_fragments.append(np.full(len(fan), fragment))
+        return np.concatenate(triangles), np.concatenate(triangle_fragments)
 
     def draw_light_source(self, painter):
         light_pos = self.light_pos
@@ -280,22 +1322,30 @@ class SceneWidget(QWidget):
             return QPoint(int(px), int(py))
         return QPoint(-1000, -1000)
 
+    def camera_matrix(self):
+        # Матрица камеры строится один раз на её положение и поворот, а не при каждом вызове
+        key = tuple(self.camera_rot) + (self.camera_pos.x, self.camera_pos.y, self.camera_pos.z)
+        if key != self.camera_key:
+            rot_x = Matrix4x4.rotation_x(self.camera_rot[0])
+            rot_y = Matrix4x4.rotation_y(self.camera_rot[1])
+            rot_z = Matrix4x4.rotation_z(self.camera_rot[2])
+            rotation = rot_x * rot_y * rot_z
+            translation = Matrix4x4.translation(-self.camera_pos.x, -self.camera_pos.y, -self.camera_pos.z)
+            self.camera_cached = rotation * translation
+            self.camera_key = key
+        return self.camera_cached
+
     def apply_camera_transform(self, v):
-        rot_x = Matrix4x4.rotation_x(self.camera_rot[0])
-        rot_y = Matrix4x4.rotation_y(self.camera_rot[1])
-        rot_z = Matrix4x4.rotation_z(self.camera_rot[2])
-        rotation = rot_x * rot_y * rot_z
-        translation = Matrix4x4.translation(-self.camera_pos.x, -self.camera_pos.y, -self.camera_pos.z)
-        camera_transform = rotation * translation
-        return camera_transform * v
+        return self.camera_matrix() * v
 
     def auto_scale_view(self):
         if self.auto_scale:
             self.base_scale = min(self.width(), self.height()) / 600.0
 
     def resizeEvent(self, event):
-        self.auto_scale_view()
-        self.invalidate_cache()
+        # Масштаб меняется вместе с кадром, который уже нарисован в новом размере
+        self.schedule_update(('resize',), None, lambda _: self.auto_scale_view(), (STAGE_TRANSFORM,),
+                             interactive=False)
         super().resizeEvent(event)
 
     def set_mirror(self, axis):
@@ -311,27 +1361,87 @@ class SceneWidget(QWidget):
             -1 if self.mirror_y else 1,
             -1 if self.mirror_z else 1
         )
-        self.object_transform = mirror_matrix
-        self.invalidate_cache()
-        self.update()
+        self.schedule_update(('mirror',), mirror_matrix, self.apply_object_transform, ALL_STAGES, interactive=False)
+
+    def apply_object_transform(self, matrix):
+        self.object_transform = matrix
+
+    def reset_view(self):
+        # Сброс встаёт в конец очереди и применяется потоком отрисовки по порядку. Из очереди
+        # выбрасываются только изменения вида, которые он всё равно затрёт; заливка, вывод, форма,
+        # текст и режимы остаются. Флаги отражения читает только set_mirror, поэтому они сбрасываются сразу
+        self.discard_pending_updates(VIEW_UPDATES)
+        self.mirror_x = False
+        self.mirror_y = False
+        self.mirror_z = False
+        self.schedule_update(('reset',), None, lambda _: self.apply_reset_view(), ALL_STAGES, interactive=False)
+
+    def apply_reset_view(self):
+        self.camera_pos = Vector3D(0, 0, -400)
+        self.camera_rot = [0, 0, 0]
+        self.d_letter.transform = Matrix4x4.rotation_x(180)
+        self.d_letter.scale = 1.0
+        self.n_letter.transform = Matrix4x4.rotation_x(180)
+        self.n_letter.scale = 1.0
+        self.object_transform = Matrix4x4()
+        self.apply_turntable_rotation(-self.turntable_angle)
+        self.base_scale = 2.0
+        self.apply_light_direction((0.5, 0.5, -1))
 
     def set_light_direction(self, x, y, z):
-        self.light_dir = Vector3D(x, y, z).normalized()
+        self.schedule_update(('light',), (x, y, z), self.apply_light_direction, (STAGE_LIGHTING,))
+
+    def apply_light_direction(self, direction):
+        self.light_dir = Vector3D(*direction).normalized()
         self.light_pos = self.light_dir * 300
-        self.invalidate_cache()
-        self.update()
 
     def rotate_letter(self, letter, axis, angle):
-        letter.rotate(axis, angle)
-        self.invalidate_cache()
-        self.update()
+        self.schedule_update(('rotate', id(letter), axis), angle,
+                             lambda total: letter.rotate(axis, total), ALL_STAGES, accumulate=True)
 
     def scale_letter(self, letter, scale_factor):
-        letter.set_scale(scale_factor)
-        self.invalidate_cache()
-        self.update()
+        self.schedule_update(('scale', id(letter)), scale_factor, letter.set_scale, ALL_STAGES)
+
+    def update_letter_geometry(self, letter, param, value):
+        # Параметр записывается в букву вместе с пересборкой сетки, последнее значение за кадр
+        self.schedule_update(('geometry', id(letter), param), value,
+                             lambda latest: self.apply_letter_param(letter, param, latest), ALL_STAGES)
+
+    @staticmethod
+    def apply_letter_param(letter, param, value):
+        setattr(letter, param, value)
+        letter.update_geometry()
+
+    def rotate_camera(self, axis, angle):
+        # Освещение и порядок BSP зависят от положения камеры, но не от её поворота
+        self.schedule_update(('camera', None, axis), angle, lambda total: self.apply_camera_rotation(axis, total),
+                             (STAGE_TRANSFORM,), accumulate=True)
+
+    def apply_camera_rotation(self, axis, angle):
+        self.camera_rot[axis] += angle
+
+    def set_near_plane(self, distance):
+        self.schedule_update(('near',), distance, self.apply_near_plane, (STAGE_TRANSFORM,), interactive=False)
+
+    def apply_near_plane(self, distance):
+        self.near_plane = distance
+
+    def active_backend(self):
+        # QPainter тратит вызов Qt на каждую грань и на длинном тексте не укладывается в кадр,
+        # поэтому большие сцены растеризуются независимо от выбранного способа вывода
+        if len(self.scene_letters()) >= RASTER_LETTERS:
+            return RenderBackend.RASTER
+        return self.render_backend
+
+    def set_render_backend(self, backend):
+        self.schedule_update(('backend',), backend, self.apply_render_backend, (), interactive=False)
+
+    def apply_render_backend(self, backend):
+        self.render_backend = backend
 
     def set_shading_mode(self, mode):
+        # Заливка берёт готовые интенсивности; недостающие досчитаются при отрисовке
+        self.schedule_update(('shading',), mode, self.apply_shading_mode, (), interactive=False)
+
+    def apply_shading_mode(self, mode):
         self.shading_mode = mode
-        self.invalidate_cache()
-        self.update()
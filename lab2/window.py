@@ -1,7 +1,8 @@
-from PySide6.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QSlider, QLabel, QPushButton, QScrollArea, QSizePolicy, QGroupBox, QTabWidget
+from PySide6.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QSlider, QLabel, QPushButton, QScrollArea, QSizePolicy, QGroupBox, QTabWidget, QPlainTextEdit
 from PySide6.QtCore import Qt
 from scene import SceneWidget
-from letters import ShadingMode, Vector3D, Matrix4x4
+from letters import ShadingMode, LetterStyle
+from raster import RenderBackend
 import math
 
 
@@ -72,6 +73,7 @@ class MainWindow(QMainWindow):
         scene_container = QWidget()
         scene_layout = QVBoxLayout(scene_container)
         self.scene = SceneWidget()
+        self.scene.start_render_thread()
         scene_layout.addWidget(self.scene)
         main_layout.addWidget(scene_container, stretch=3)
         
@@ -104,6 +106,8 @@ class MainWindow(QMainWindow):
         letters_layout = QVBoxLayout(letters_tab)
         self.create_letter_controls(letters_layout, "Буква Д", 'd')
         self.create_letter_controls(letters_layout, "Буква Н", 'n')
+        self.create_text_controls(letters_layout)
+        self.create_style_controls(letters_layout)
         tab_widget.addTab(letters_tab, "Буквы")
         
         # Вкладка "Вращение"
@@ -113,6 +117,7 @@ class MainWindow(QMainWindow):
         self.create_rotation_controls(rotation_layout, "Вращение буквы Н", 'n')
         self.create_transform_controls(rotation_layout, "Управление камерой",
                                      self.rotate_camera, None)
+        self.create_animation_controls(rotation_layout)
         tab_widget.addTab(rotation_tab, "Вращение")
         
         # Вкладка "Заливка"
@@ -148,6 +153,11 @@ class MainWindow(QMainWindow):
         right_panel.setStretch(1, 0)
         main_layout.addLayout(right_panel, stretch=1)
 
+    def closeEvent(self, event):
+        # Поток отрисовки останавливается до разрушения виджета сцены
+        self.scene.stop_render_thread()
+        super().closeEvent(event)
+
     def create_letter_controls(self, layout, title, prefix):
         group = QGroupBox(title)
         group_layout = QVBoxLayout(group)
@@ -178,6 +188,36 @@ class MainWindow(QMainWindow):
 
         layout.addWidget(group)
 
+    def create_text_controls(self, layout):
+        group = QGroupBox("Текст")
+        group_layout = QVBoxLayout(group)
+        group_layout.setSpacing(8)
+
+        text_edit = QPlainTextEdit()
+        text_edit.setPlaceholderText("Любой текст, строки через Enter; пусто — исходная пара")
+        text_edit.setFixedHeight(70)
+        group_layout.addWidget(text_edit)
+
+        btn = QPushButton("Показать текст")
+        btn.setMinimumHeight(35)
+        btn.clicked.connect(lambda: self.scene.set_text(text_edit.toPlainText()))
+        group_layout.addWidget(btn)
+
+        layout.addWidget(group)
+
+    def create_style_controls(self, layout):
+        group = QGroupBox("Форма букв")
+        group_layout = QVBoxLayout(group)
+        group_layout.setSpacing(8)
+        for style in LetterStyle:
+            btn = QPushButton(style.value)
+            btn.setCheckable(True)
+            btn.setMinimumHeight(35)
+            btn.setChecked(style == LetterStyle.FLAT)
+            btn.clicked.connect(lambda _, st=style: self.update_style(st))
+            group_layout.addWidget(btn)
+        layout.addWidget(group)
+
     def create_rotation_controls(self, layout, title, letter_prefix):
         group = QGroupBox(title)
         group_layout = QVBoxLayout(group)
@@ -227,6 +267,19 @@ class MainWindow(QMainWindow):
 
         layout.addWidget(group)
 
+    def create_animation_controls(self, layout):
+        group = QGroupBox("Анимация")
+        group_layout = QVBoxLayout(group)
+        group_layout.setSpacing(10)
+
+        btn = QPushButton("Вращение по кругу")
+        btn.setCheckable(True)
+        btn.setMinimumHeight(35)
+        btn.toggled.connect(self.scene.set_turntable)
+        group_layout.addWidget(btn)
+
+        layout.addWidget(group)
+
     def create_mirror_controls(self, layout):
         group = QGroupBox("Зеркальное отображение")
         group_layout = QHBoxLayout(group)
@@ -273,12 +326,21 @@ class MainWindow(QMainWindow):
             group_layout.addWidget(btn)
         layout.addWidget(group)
 
+        group = QGroupBox("Растеризация")
+        group_layout = QVBoxLayout(group)
+        group_layout.setSpacing(8)
+        for backend in RenderBackend:
+            btn = QPushButton(backend.value)
+            btn.setCheckable(True)
+            btn.setMinimumHeight(35)
+            btn.setChecked(backend == RenderBackend.PAINTER)
+            btn.clicked.connect(lambda _, b=backend: self.update_backend(b))
+            group_layout.addWidget(btn)
+        layout.addWidget(group)
+
     def update_letter_param(self, prefix, param, value):
         letter = getattr(self.scene, f"{prefix}_letter")
-        setattr(letter, param, value)
-        letter.update_geometry()
-        self.scene.invalidate_cache()
-        self.scene.update()
+        self.scene.update_letter_geometry(letter, param, value)
 
     def update_letter_scale(self, prefix, value):
         letter = getattr(self.scene, f"{prefix}_letter")
@@ -290,9 +352,7 @@ class MainWindow(QMainWindow):
         self.scene.rotate_letter(letter, axis, angle)
 
     def rotate_camera(self, axis, angle):
-        self.scene.camera_rot[axis] += angle
-        self.scene.invalidate_cache()
-        self.scene.update()
+        self.scene.rotate_camera(axis, angle)
 
     def update_light(self, axis, value):
         rad = math.radians(value)
@@ -319,18 +379,17 @@ class MainWindow(QMainWindow):
             if btn.text() in [m.value for m in ShadingMode]:
                 btn.setChecked(btn.text() == mode.value)
 
+    def update_style(self, style):
+        self.scene.set_letter_style(style)
+        for btn in self.findChildren(QPushButton):
+            if btn.text() in [st.value for st in LetterStyle]:
+                btn.setChecked(btn.text() == style.value)
+
+    def update_backend(self, backend):
+        self.scene.set_render_backend(backend)
+        for btn in self.findChildren(QPushButton):
+            if btn.text() in [b.value for b in RenderBackend]:
+                btn.setChecked(btn.text() == backend.value)
+
     def reset_view(self):
-        self.scene.camera_pos = Vector3D(0, 0, -400)
-        self.scene.camera_rot = [0, 0, 0]
-        self.scene.d_letter.transform = Matrix4x4.rotation_x(180)
-        self.scene.d_letter.scale = 1.0
-        self.scene.n_letter.transform = Matrix4x4.rotation_x(180)
-        self.scene.n_letter.scale = 1.0
-        self.scene.object_transform = Matrix4x4()
-        self.scene.base_scale = 2.0
-        self.scene.mirror_x = False
-        self.scene.mirror_y = False
-        self.scene.mirror_z = False
-        self.scene.set_light_direction(0.5, 0.5, -1)
-        self.scene.invalidate_cache()
-        self.scene.update()
\ No newline at end of file
+        self.scene.reset_view()
\ No newline at end of file